@@ -0,0 +1,292 @@
+from datetime import datetime
+from functools import partial
+import sublime
+import sublime_plugin
+import json
+import os
+import platform
+import random
+import time
+import TabNav.src as tabnav
+
+log = tabnav.get_logger(__package__, __name__)
+
+# The generated tables: (format, rows, columns, variant)
+benchmark_tables = [
+	('markdown', 100, 5, 'aligned'),
+	('markdown', 10000, 10, 'ragged'),
+	('markdown', 100000, 20, 'aligned'),
+	('markdown', 1000000, 5, 'aligned'),
+	('markdown', 1000, 500, 'aligned'),
+	('orgmode', 10000, 10, 'markup_rows'),
+	('orgmode', 100000, 5, 'aligned'),
+	('orgmode', 1000000, 5, 'markup_rows'),
+	('textile', 10000, 10, 'header_markup'),
+	('textile', 1000000, 5, 'header_markup'),
+	('csv', 100, 2, 'unquoted'),
+	('csv', 10000, 10, 'quoted'),
+	('csv', 50000, 10, 'quoted'),
+	('csv', 100000, 10, 'ragged'),
+	('csv', 1000000, 2, 'unquoted'),
+	('csv', 10000, 500, 'quoted'),
+]
+
+# The timed commands: (name, command, args, number of cursors, setup command and args)
+# The cursors are spread over the table's rows, in the first cell of each row.
+benchmark_operations = [
+	('move right', 'tabnav_move', {'scope': 'row', 'select': False}, 1, None),
+	('move right, many cursors', 'tabnav_move', {'scope': 'row', 'select': False}, 2000, None),
+	('move down', 'tabnav_move', {'scope': 'column', 'select': False}, 1, None),
+	('move down, many cursors', 'tabnav_move', {'scope': 'column', 'select': False}, 2000, None),
+	('move down 10 rows', 'tabnav_move', {'scope': 'column', 'count': 10, 'select': False}, 1, None),
+	('page down', 'tabnav_move', {'scope': 'column', 'page': True, 'select': False}, 1, None),
+	('extend selection down', 'tabnav_move', {'scope': 'column', 'extend': 1}, 1, None),
+	('select end of row', 'tabnav_move_end', {'scope': 'row'}, 2000, None),
+	('select end of column', 'tabnav_move_end', {'scope': 'column'}, 1, None),
+	('extend selection to end of column', 'tabnav_move_end', {'scope': 'column', 'extend': True}, 1, None),
+	('select row', 'tabnav_select', {'scope': 'row'}, 2000, None),
+	('select column', 'tabnav_select', {'scope': 'column'}, 1, None),
+	('select table', 'tabnav_select', {'scope': 'table'}, 1, None),
+	('copy rows delimited', 'tabnav_copy_delimited', {'delimiter': '\t'}, 2000, ('tabnav_select', {'scope': 'row'})),
+]
+
+# The most milliseconds that a cold run of an operation should take, keyed by (format, rows, columns, variant, operation).
+# Runs over their target are marked in the summary.
+benchmark_targets = {
+	('csv', 50000, 10, 'quoted', 'select column'): 1000,
+	('csv', 50000, 10, 'quoted', 'select table'): 1000,
+}
+
+# The file extension of each format's syntax (or None for plain text), the number of rows before its
+# tables' data rows, and the column of a cursor in the first cell of a data row
+table_formats = {
+	'markdown': ('md', 2, 2),
+	'orgmode': ('org', 2, 2),
+	'textile': ('textile', 1, 2),
+	'csv': (None, 1, 1),
+}
+
+words = ['Tony', 'Armas', 'PIT', 'Starting Pitcher', 'First Baseman', 'Outfielder', 'Relief', 'TEX', 'Shortstop', 'Catcher']
+
+
+def cell_value(rand, r, c):
+	if c % 3 == 0:
+		return '{0} {1}'.format(rand.choice(words), r)
+	return str(rand.randint(10, 100000) / 100)
+
+
+def pipe_row(values, widths=None):
+	if widths is not None:
+		values = [v.ljust(w) for v, w in zip(values, widths)]
+	return '| ' + ' | '.join(values) + ' |'
+
+
+def markdown_table(rand, rows, columns, variant):
+	'''Generates a Markdown table, with its header and separator rows, modelled on the Markdown test files.
+
+	The 'aligned' variant pads every cell to the same width, and the 'ragged' variant has rows with
+	fewer cells than the header, some of which don't end with a pipe.'''
+	widths = [14] * columns if variant == 'aligned' else None
+	lines = [pipe_row(['Column {0}'.format(c + 1) for c in range(columns)], widths)]
+	if widths is not None:
+		lines.append('|' + '|'.join(':' + '-' * (w + 1) for w in widths) + '|')
+	else:
+		lines.append('|' + '|'.join(':---' for c in range(columns)) + '|')
+	for r in range(rows):
+		n = columns if variant != 'ragged' else rand.randint(1, columns)
+		line = pipe_row([cell_value(rand, r, c) for c in range(n)], widths)
+		if variant == 'ragged' and r % 3 == 0:
+			line = line[:-2]
+		lines.append(line)
+	return lines
+
+
+def orgmode_table(rand, rows, columns, variant):
+	'''Generates an Org Mode table, modelled on the Org Mode test files.
+
+	The 'markup_rows' variant has a separator row after every ten rows.'''
+	widths = [14] * columns
+	separator = '|' + '+'.join('-' * (w + 2) for w in widths) + '|'
+	lines = [pipe_row(['Column {0}'.format(c + 1) for c in range(columns)], widths), separator]
+	for r in range(rows):
+		lines.append(pipe_row([cell_value(rand, r, c) for c in range(columns)], widths))
+		if variant == 'markup_rows' and r % 10 == 9:
+			lines.append(separator)
+	return lines
+
+
+def textile_table(rand, rows, columns, variant):
+	'''Generates a Textile table, modelled on the Textile test file.
+
+	The 'header_markup' variant has a header row, and style markup on some of the cells.'''
+	lines = ['|' + '|'.join('_. Column {0} '.format(c + 1) for c in range(columns)) + '|']
+	for r in range(rows):
+		values = [cell_value(rand, r, c) for c in range(columns)]
+		if variant == 'header_markup':
+			values = ['{color:red}. ' + v if c % 4 == 1 else v for c, v in enumerate(values)]
+		lines.append(pipe_row(values))
+	return lines
+
+
+def csv_table(rand, rows, columns, variant):
+	'''Generates a comma-delimited CSV table, modelled on the CSV test files.
+
+	The 'quoted' variant quotes every other cell, including delimiters and escaped quotes,
+	and the 'ragged' variant has rows with fewer cells than the header.'''
+	lines = [','.join('Column {0}'.format(c + 1) for c in range(columns))]
+	for r in range(rows):
+		n = columns if variant != 'ragged' else rand.randint(1, columns)
+		values = [cell_value(rand, r, c) for c in range(n)]
+		if variant == 'quoted':
+			values = ['"{0}, ""quoted"""'.format(v) if c % 2 == 1 else v for c, v in enumerate(values)]
+		lines.append(','.join(values))
+	return lines
+
+
+table_generators = {
+	'markdown': markdown_table,
+	'orgmode': orgmode_table,
+	'textile': textile_table,
+	'csv': csv_table,
+}
+
+
+class BenchmarkRun():
+	'''Times the benchmark operations on each of the generated tables, one table at a time,
+	so that Sublime Text stays responsive between tables.'''
+	def __init__(self, window, max_rows, output_path):
+		self.window = window
+		self.tables = [t for t in benchmark_tables if max_rows is None or t[1] <= max_rows]
+		self.output_path = output_path
+		self.results = []
+		self.skipped = []
+		self.start_time = datetime.now()
+		self.package_settings = sublime.load_settings("tabnav.sublime-settings")
+		self.initial_warm_up_margin = self.package_settings.get('warm_up_margin')
+		self.initial_clipboard = sublime.get_clipboard()
+
+	def start(self):
+		# Background parsing would make the cold timings depend on how long each view had been open
+		self.package_settings.set('warm_up_margin', None)
+		self.run_next_table(0)
+
+	def run_next_table(self, i):
+		if i == len(self.tables):
+			self.finish()
+			return
+		table = self.tables[i]
+		sublime.status_message("TabNav: benchmarking {0} table {1} of {2}".format(table[0], i + 1, len(self.tables)))
+		try:
+			self.run_table(*table)
+		except Exception as e:
+			log.error("Benchmark of %s failed: %s", table, e)
+			self.skipped.append({'table': table, 'reason': str(e)})
+		sublime.set_timeout(partial(self.run_next_table, i + 1), 10)
+
+	def run_table(self, table_format, rows, columns, variant):
+		extension, header_rows, cursor_col = table_formats[table_format]
+		syntax = None
+		if extension is not None:
+			syntaxes = sublime.find_syntax_by_extension(extension)
+			if len(syntaxes) == 0:
+				self.skipped.append({'table': [table_format, rows, columns, variant], 'reason': 'No syntax for .' + extension})
+				return
+			syntax = syntaxes[0]
+		lines = table_generators[table_format](random.Random(rows * columns), rows, columns, variant)
+		view = self.window.new_file()
+		view.set_scratch(True)
+		try:
+			if syntax is not None:
+				view.assign_syntax(syntax)
+			view.settings().set('tabnav.enabled', True)
+			if table_format == 'csv':
+				view.settings().set('tabnav.delimiter', ',')
+			view.run_command('append', {'characters': '\n'.join(lines), 'force': True})
+			data_rows = range(header_rows, len(lines))
+			for capture_level in tabnav.capture_levels:
+				view.settings().set('tabnav.capture_level', capture_level)
+				for name, command, args, cursors, setup in benchmark_operations:
+					timings = [self.time_operation(view, data_rows, cursor_col, command, args, cursors, setup, cold) for cold in (True, False)]
+					target = benchmark_targets.get((table_format, rows, columns, variant, name))
+					self.results.append({
+						'format': table_format,
+						'rows': rows,
+						'columns': columns,
+						'variant': variant,
+						'capture_level': capture_level,
+						'operation': name,
+						'command': command,
+						'args': args,
+						'cursors': min(cursors, len(data_rows)),
+						'cold_ms': timings[0],
+						'warm_ms': timings[1],
+						'selections': len(view.sel()),
+						'target_ms': target,
+						'over_target': target is not None and timings[0] > target,
+					})
+		finally:
+			view.close()
+
+	def time_operation(self, view, data_rows, cursor_col, command, args, cursors, setup, cold):
+		'''Times a single run of the command, from cursors spread over the table's data rows.
+
+		For a cold run, all of the view's parsed rows are discarded first.'''
+		if cold:
+			tabnav.clear_row_caches(view.buffer_id())
+			tabnav.clear_query_memos(view.id())
+		cursors = min(cursors, len(data_rows))
+		step = len(data_rows) / cursors
+		points = [view.text_point(data_rows[int(i * step)], cursor_col) for i in range(cursors)]
+		view.sel().clear()
+		view.sel().add_all([sublime.Region(p, p) for p in points])
+		if setup is not None:
+			view.run_command(*setup)
+		start = time.perf_counter()
+		view.run_command(command, args)
+		return round((time.perf_counter() - start) * 1000, 3)
+
+	def finish(self):
+		self.package_settings.set('warm_up_margin', self.initial_warm_up_margin)
+		sublime.set_clipboard(self.initial_clipboard)
+		duration = datetime.now() - self.start_time
+		output = {
+			'started': self.start_time.strftime('%Y-%m-%dT%H:%M:%S'),
+			'duration_s': round(duration.total_seconds(), 1),
+			'sublime_version': sublime.version(),
+			'platform': platform.platform(),
+			'python_version': platform.python_version(),
+			'results': self.results,
+			'skipped': self.skipped,
+		}
+		os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+		with open(self.output_path, 'w', encoding='utf-8') as f:
+			json.dump(output, f, indent=1)
+		self.print_summary(duration)
+
+	def print_summary(self, duration):
+		output_panel = self.window.create_output_panel('tabnav_benchmark_results')
+		output_panel.run_command('append', {'characters': 'TabNav Benchmarks\n\nResults: {0}\nTables:{1:6d}\nSkipped:{2:5d}\nDuration:{3:7.1f}s\n\n'.format(
+			self.output_path, len(self.tables) - len(self.skipped), len(self.skipped), duration.total_seconds())})
+		output_panel.run_command('append', {'characters': '{0:<9} {1:>8} {2:>4} {3:<13} {4:<8} {5:<34} {6:>10} {7:>10}\n'.format(
+			'format', 'rows', 'cols', 'variant', 'level', 'operation', 'cold ms', 'warm ms')})
+		for result in self.results:
+			line = '{format:<9} {rows:>8} {columns:>4} {variant:<13} {capture_level:<8} {operation:<34} {cold_ms:>10.1f} {warm_ms:>10.1f}'.format(**result)
+			if result['over_target']:
+				line = line + '  over target of {0} ms'.format(result['target_ms'])
+			output_panel.run_command('append', {'characters': line + '\n'})
+		for skipped in self.skipped:
+			output_panel.run_command('append', {'characters': 'Skipped {0}: {1}\n'.format(skipped['table'], skipped['reason'])})
+		self.window.run_command("show_panel", {"panel": "output.tabnav_benchmark_results"})
+
+
+class TabnavRunBenchmarksCommand(sublime_plugin.WindowCommand):
+	'''Times TabNav's commands on generated tables of each format, at each capture level, and writes the
+	results to a JSON file, so that runs can be compared to find changes in performance.
+
+	Only the tables with at most max_rows rows are generated, or all of them if max_rows is None.
+	By default, the results are written to a new file in the TabNav folder of Sublime Text's cache.'''
+	def run(self, max_rows=10000, output_path=None):
+		if output_path is None:
+			file_name = 'benchmark-{0}.json'.format(datetime.now().strftime('%Y%m%d-%H%M%S'))
+			output_path = os.path.join(sublime.cache_path(), 'TabNav', file_name)
+		BenchmarkRun(self.window, max_rows, output_path).start()
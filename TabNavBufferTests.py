@@ -0,0 +1,106 @@
+'''Checks TabNav's table parsing outside of Sublime Text, using TextBuffers.
+
+The whole-table selection test cases of the parsing test files are re-run against a TextBuffer of each
+test file, and the cells of the selected tables compared with the test's expected selections. Only the
+tests that don't depend on Sublime Text's syntaxes are run: those of files whose whole text has a single
+scope, such as Markdown, Org mode and plain text CSV files.
+
+Run from Sublime Text's Packages directory, or any directory containing the TabNav package:
+
+	python -m TabNav.TabNavBufferTests
+'''
+import glob
+import json
+import os
+import sys
+import TabNav.src as tabnav
+
+current_dir = os.path.dirname(os.path.realpath(__file__))
+test_cases_dir = os.path.join(current_dir, "test_cases")
+test_files_dir = os.path.join(current_dir, "test_files")
+
+# The scope of a TextBuffer of each test file, by extension
+file_scopes = {
+	'.csv': 'text.plain',
+	'.md': 'text.html.markdown',
+	'.org': 'text.orgmode',
+}
+# The syntaxes of test cases that a single-scope TextBuffer can stand in for
+plain_syntaxes = (None, "Packages/Text/Plain text.tmLanguage")
+table_args = ('scope', 'context', 'capture_level')
+
+
+def enumerate_buffer_test_cases():
+	'''Gets the (test case file, test definition) of each parsing test case that can be run against a TextBuffer.'''
+	for path in sorted(glob.glob(os.path.join(test_cases_dir, "parsing_*.json"))):
+		with open(path, encoding='utf-8') as f:
+			test_definitions = json.load(f)
+		for test in test_definitions:
+			args = test.get('args', {})
+			if test['command'] != 'tabnav_select' or args.get('scope') != 'table' or any(arg not in table_args for arg in args):
+				continue
+			if test.get('syntax') not in plain_syntaxes or os.path.splitext(test['file'])[1] not in file_scopes:
+				continue
+			yield os.path.basename(path), test
+
+
+def select_tables(buffer, context, points):
+	'''Gets the regions of the cells of the tables at the given points, as the tabnav_select command selects them.'''
+	table = tabnav.TableView(buffer, context)
+	tables = dict(table.table_bounds(table.row_at_point(point).row) for point in points)
+	rows = [row for first_row, last_row in tables.items() for row in table.table_rows(first_row, last_row)]
+	regions = [region for row in rows for region in row.regions(context.capture_level)]
+	if len(regions) == 0:
+		regions = [region for row in rows for region in row.regions()]
+	return regions
+
+
+def run_buffer_test_case(test):
+	'''Runs a single test case against a TextBuffer of its test file, returning None if it passes, or the reason it failed.'''
+	package_settings = tabnav.load_settings("tabnav.sublime-settings")
+	initial_package_settings = {setting: package_settings.get(setting) for setting in test.get('package_settings', {})}
+	for setting, value in test.get('package_settings', {}).items():
+		package_settings.set(setting, value)
+	tabnav.reload_contexts()
+	view_settings = {setting: value for setting, value in test.get('view_settings', {}).items() if value is not None}
+	scope = file_scopes[os.path.splitext(test['file'])[1]]
+	buffer = tabnav.TextBuffer.from_file(os.path.join(test_files_dir, test['file']), scope=scope, settings=view_settings)
+	try:
+		points = [s['b'] for s in test['initial_selections']]
+		buffer.sel().add_all(points)
+		args = test.get('args', {})
+		context = tabnav.get_current_context(buffer, args.get('context'), args.get('capture_level'))
+		if context is None:
+			return "No context"
+		try:
+			selections = sorted((region.a, region.b) for region in select_tables(buffer, context, points))
+		except (tabnav.CursorNotInTableError, tabnav.RowNotInTableError, tabnav.RowOutOfFileBounds) as e:
+			return e.err
+		expected_selections = sorted((s['a'], s['b']) for s in test['expected_selections'])
+		if selections != expected_selections:
+			return "Expected {0} but got {1}".format(expected_selections, selections)
+		return None
+	finally:
+		tabnav.clear_row_caches(buffer.buffer_id())
+		for setting, value in initial_package_settings.items():
+			package_settings.set(setting, value)
+		tabnav.reload_contexts()
+
+
+def run_buffer_tests():
+	'''Runs every test case that can be run against a TextBuffer, printing the failures. Returns the number of failures.'''
+	passed = 0
+	failed = 0
+	for test_case_file, test in enumerate_buffer_test_cases():
+		message = run_buffer_test_case(test)
+		if message is None:
+			passed = passed + 1
+		else:
+			failed = failed + 1
+			print("FAIL | {0} | {1} | {2} | {3}".format(test['id'], test_case_file, test['description'], message))
+	print("TextBuffer tests: {0} passed, {1} failed".format(passed, failed))
+	return failed
+
+
+if __name__ == '__main__':
+	sys.exit(1 if run_buffer_tests() > 0 else 0)
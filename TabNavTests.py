@@ -9,6 +9,9 @@ import base64
 import uuid
 import json
 import TabNav.src as tabnav
+from TabNav.src.context import _format_csv_patterns
+from TabNav.src.query import _memos as query_memos
+from TabNav.src.tokenizer import compile_csv_tokenizer
 
 log = tabnav.get_logger(__package__, __name__)
 log.setLevel("ERROR")
@@ -35,6 +38,21 @@ class TestCase():
 		self.syntax = test_definition.get('syntax')
 		self.view_settings = test_definition.get('view_settings', {})
 		self.package_settings = test_definition.get('package_settings', {})
+		# The visible region depends on the size of the window, so tests of commands that use it set a fixed one
+		visible_region = test_definition.get('visible_region')
+		self.visible_region = None if visible_region is None else (visible_region['a'], visible_region['b'])
+		# Tests of edits run the command once before replacing the text, so that the rows it parsed are cached when it's run again
+		self.edits = [(e['a'], e['b'], e['text']) for e in test_definition.get('edits', [])]
+		self.edits_made = 0
+		# Tests of repeated commands run the command that many times, each from the selections left by the last
+		self.repeat = test_definition.get('repeat', 1)
+		# Tests of the is_tabnav_context key binding context check it just before the edits and the command, as a key press does,
+		# and whether the command was handed the TableView that the check built
+		query = test_definition.get('query')
+		self.query_match_all = None if query is None else query.get('match_all', False)
+		self.query_handed_over = None if query is None else query['handed_over']
+		# Tests of the warm-up warm up the view after each edit, before the change reaches the row cache, so it must be abandoned
+		self.warm_up_margin = test_definition.get('warm_up_margin')
 		self.initial_syntax = None
 		self.initial_package_settings = {}
 		self.initial_view_settings = {}
@@ -134,10 +152,39 @@ def setup_test_case(view, test):
 		log.debug("Exception setting-up test case %s: %s", test.test_id, e)
 		return TestResult(test, False, str(e))
 
+def run_test_command(view, test):
+	if test.visible_region is None:
+		view.run_command(test.command_name, args=test.command_args)
+	else:
+		visible_region = sublime.View.visible_region
+		sublime.View.visible_region = lambda v: sublime.Region(*test.visible_region)
+		try:
+			view.run_command(test.command_name, args=test.command_args)
+		finally:
+			sublime.View.visible_region = visible_region
+
 def run_test_case(view, test):
 	log.debug("Run test case %s", test.test_id)
 	try:
-		view.run_command(test.command_name, args=test.command_args)
+		if len(test.edits) > 0:
+			run_test_command(view, test)
+			# The initial selections are moved along with the text by the edits, so the expected selections are after the edits
+			view.sel().clear()
+			view.sel().add_all([sublime.Region(a, b) for a,b in test.initial_selections])
+		if test.query_match_all is not None:
+			tabnav.clear_query_memos(view.id())
+			assert tabnav.is_tabnav_context(view, test.command_args.get('context'), test.query_match_all), "Not in a TabNav context"
+			memo = query_memos[view.id()]
+		for a, b, text in test.edits:
+			view.run_command('tabnav_test_replace', {'a': a, 'b': b, 'text': text, 'warm_up_margin': test.warm_up_margin})
+			test.edits_made = test.edits_made + 1
+			if test.warm_up_margin is not None:
+				assert TabnavTestReplaceCommand.warmed_up is False, "The warm-up wasn't abandoned after the edit"
+		for i in range(test.repeat):
+			run_test_command(view, test)
+		if test.query_match_all is not None:
+			handed_over = memo.table is None
+			assert handed_over == test.query_handed_over, "Expected the query's table to be handed over: {0}, but it was: {1}".format(test.query_handed_over, handed_over)
 		selections = list(view.sel())
 		assert (len(selections) == len(test.expected_selections)), "Expected {0} selections but got {1}: {2}".format(len(test.expected_selections), len(selections), selections)
 		for region in selections:
@@ -230,6 +277,9 @@ def print_test_results():
 def clear_test_case(view, test):
 	log.debug("Clearing test case %s", test.test_id)
 	package_settings = sublime.load_settings("tabnav.sublime-settings")
+	for i in range(test.edits_made):
+		view.run_command('undo')
+	test.edits_made = 0
 	view.set_syntax_file(test.initial_syntax)
 	for setting in test.initial_view_settings:
 		view.settings().set(setting, test.initial_view_settings[setting])
@@ -258,6 +308,11 @@ annotation_template = '''
 		<br><b>syntax:</b> {test.syntax}
 		<br><b>view_settings:</b> {test.view_settings}
 		<br><b>package_settings:</b> {test.package_settings}
+		<br><b>visible_region:</b> {test.visible_region}
+		<br><b>edits:</b> {test.edits}
+		<br><b>repeat:</b> {test.repeat}
+		<br><b>query match_all:</b> {test.query_match_all}
+		<br><b>warm_up_margin:</b> {test.warm_up_margin}
 		<br>
 	</body>'''
 
@@ -438,6 +493,19 @@ class TabnavNewTestIdsCommand(sublime_plugin.TextCommand):
 			self.view.replace(edit, region, new_id)
 
 
+class TabnavTestReplaceCommand(sublime_plugin.TextCommand):
+	'''Replaces the text from a to b, for the test cases that edit the view.
+
+	If a warm-up margin is given, the view is then warmed up within the same command, before the change
+	is reported to the row cache, and whether the warm-up parsed all of its rows is kept in warmed_up.'''
+	warmed_up = None
+
+	def run(self, edit, a, b, text, warm_up_margin=None):
+		self.view.replace(edit, sublime.Region(a, b), text)
+		if warm_up_margin is not None:
+			TabnavTestReplaceCommand.warmed_up = tabnav.warm_up_view(self.view, warm_up_margin)
+
+
 class TabnavCopyRegionCoordsCommand(sublime_plugin.TextCommand):
 	def run(self, edit):
 		regions = [{'a': r.a, 'b': r.b} for r in self.view.sel()]
@@ -454,6 +522,41 @@ class TabnavSetRegionsFromClipboardCommand(sublime_plugin.TextCommand):
 		self.view.sel().add_all(regions)
 
 
+class TabnavCsvTokenizerTestsCommand(sublime_plugin.WindowCommand):
+	'''Compares the cells found by the auto_csv fast tokenizer against those found by the auto_csv patterns,
+	for every line of the CSV test files, with each of the auto delimiters and capture levels.'''
+	def run(self):
+		start = datetime.now()
+		config = tabnav.get_context_configs()['auto_csv']
+		patterns = config.get('patterns')
+		lines = []
+		for file_name in sorted(os.listdir(test_files_dir)):
+			if file_name.startswith('csv'):
+				with open(os.path.join(test_files_dir, file_name), encoding='utf-8') as f:
+					lines.extend(f.read().split('\n'))
+		total = 0
+		failures = []
+		for delimiter in config.get('auto_delimiters'):
+			for capture_level, (level, description) in tabnav.capture_levels.items():
+				context = tabnav.TabnavContext(_format_csv_patterns(patterns, delimiter), capture_level)
+				tokenizer = compile_csv_tokenizer(patterns, delimiter, level)
+				if tokenizer is None:
+					failures.append("{0!r} {1}: no tokenizer".format(delimiter, capture_level))
+					continue
+				for line in lines:
+					total = total + 1
+					row = context.parse_row(line, 0, 0)
+					expected = list(row._data) if row is not None else []
+					actual = list(tokenizer.tokenize(line))
+					if actual != expected:
+						failures.append("{0!r} {1}: {2!r}\n\tExpected: {3}\n\tActual:   {4}".format(delimiter, capture_level, line, expected, actual))
+		duration = datetime.now() - start
+		output_panel = self.window.create_output_panel('tabnav_test_results')
+		output_panel.run_command('append', {'characters': 'TabNav CSV Tokenizer Tests\n\nTOTAL:{0:8d}\nPASS:{1:9d}\nFAIL:{2:9d}\nDuration:{3:5.1f}s\n\n'.format(total, total - len(failures), len(failures), duration.total_seconds())})
+		output_panel.run_command('append', {'characters': '\n'.join(failures)})
+		self.window.run_command("show_panel", {"panel": "output.tabnav_test_results"})
+
+
 class TabnavSelectionChangedListener(sublime_plugin.EventListener):
 	def __init__(self):
 		self.key = 'tabnav.region'
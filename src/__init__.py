@@ -1,7 +1,12 @@
 from TabNav.src.exceptions import *
 from TabNav.src.enum import *
 from TabNav.src.util import *
-from TabNav.src.table import TableCell, TableRow, TableColumn, TableView
+from TabNav.src.stats import add_count, clear_stats, command_stats, format_stats, set_stats_enabled, timed, timed_command
+from TabNav.src.buffer import TextBuffer
+from TabNav.src.cache import clear_row_caches, update_row_cache
+from TabNav.src.table import TableCell, TableRow, TableColumn, TableColumnIndex, TableView
 from TabNav.src.parsing import RowParser
-from TabNav.src.context import TabnavContext, get_current_context
+from TabNav.src.context import TabnavContext, clear_sniffed_delimiters, get_current_context, get_context_configs, reload_contexts
 from TabNav.src.navigator import TableNavigator
+from TabNav.src.query import clear_query_memos, get_query_context, is_tabnav_context, take_query_table
+from TabNav.src.warmup import warm_up_view
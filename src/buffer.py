@@ -0,0 +1,329 @@
+from itertools import accumulate, count
+import bisect
+import json
+import os
+import re
+
+try:
+	import sublime
+except ImportError:
+	sublime = None # running outside of Sublime Text, such as in a script or benchmark
+
+_package_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_buffer_ids = count(-1, -1) # negative, so that they never collide with the IDs of Sublime Text's buffers
+_settings = {} # Settings loaded outside of Sublime Text, keyed by file name
+
+
+if sublime is not None:
+	Region = sublime.Region
+else:
+	class Region:
+		'''A stand-in for sublime.Region, with the same behaviour, for use outside of Sublime Text.'''
+		__slots__ = ('a', 'b', 'xpos')
+
+		def __init__(self, a, b=None, xpos=-1):
+			if b is None:
+				b = a
+			self.a = a
+			self.b = b
+			self.xpos = xpos
+
+		def __repr__(self):
+			return "({}, {})".format(self.a, self.b)
+
+		def __len__(self):
+			return self.size()
+
+		def __eq__(self, rhs):
+			return isinstance(rhs, Region) and self.a == rhs.a and self.b == rhs.b
+
+		def __lt__(self, rhs):
+			if self.begin() == rhs.begin():
+				return self.end() < rhs.end()
+			return self.begin() < rhs.begin()
+
+		def __contains__(self, v):
+			if isinstance(v, Region):
+				return v.a in self and v.b in self
+			return self.begin() <= v <= self.end()
+
+		def begin(self):
+			return min(self.a, self.b)
+
+		def end(self):
+			return max(self.a, self.b)
+
+		def size(self):
+			return abs(self.a - self.b)
+
+		def empty(self):
+			return self.a == self.b
+
+		def cover(self, rhs):
+			a = min(self.begin(), rhs.begin())
+			b = max(self.end(), rhs.end())
+			return Region(a, b) if self.a < self.b else Region(b, a)
+
+		def intersection(self, rhs):
+			if self.end() <= rhs.begin() or rhs.end() <= self.begin():
+				return Region(0)
+			return Region(max(self.begin(), rhs.begin()), min(self.end(), rhs.end()))
+
+		def intersects(self, rhs):
+			lb, le = self.begin(), self.end()
+			rb, rend = rhs.begin(), rhs.end()
+			return (lb == rb and le == rend) or (rb > lb and rb < le) or (rend > lb and rend < le) \
+				or (lb > rb and lb < rend) or (le > rb and le < rend)
+
+		def contains(self, x):
+			if isinstance(x, Region):
+				return self.contains(x.a) and self.contains(x.b)
+			return self.begin() <= x <= self.end()
+
+
+def load_settings(name):
+	'''Gets the named package settings, as sublime.load_settings does.
+
+	Outside of Sublime Text, the settings are read from the package's own copy of the file,
+	without any user overrides.'''
+	if sublime is not None:
+		return sublime.load_settings(name)
+	settings = _settings.get(name)
+	if settings is None:
+		path = os.path.join(_package_path, name)
+		values = {}
+		if os.path.exists(path):
+			with open(path, encoding='utf-8') as f:
+				values = json.loads(_strip_json_comments(f.read()))
+		settings = Settings(values)
+		_settings[name] = settings
+	return settings
+
+
+def _strip_json_comments(text):
+	'''Removes the comments and trailing commas that Sublime Text allows in its JSON files.'''
+	out = []
+	i = 0
+	n = len(text)
+	while i < n:
+		c = text[i]
+		if c == '"':
+			# Copy the whole string, including any escaped quotes
+			j = i + 1
+			while text[j] != '"':
+				j = j + (2 if text[j] == '\\' else 1)
+			out.append(text[i:j+1])
+			i = j + 1
+		elif text.startswith('//', i):
+			i = text.find('\n', i)
+			if i < 0:
+				i = n
+		elif text.startswith('/*', i):
+			i = text.index('*/', i) + 2
+		else:
+			if c in ']}':
+				# Drop a comma before the closing bracket
+				k = len(out) - 1
+				while k >= 0 and out[k].isspace():
+					k = k - 1
+				if k >= 0 and out[k] == ',':
+					del out[k]
+			out.append(c)
+			i = i + 1
+	return ''.join(out)
+
+
+class Settings:
+	'''A stand-in for sublime.Settings, backed by a dictionary.'''
+	def __init__(self, values=None):
+		self._values = dict(values) if values is not None else {}
+
+	def get(self, key, default=None):
+		return self._values.get(key, default)
+
+	def has(self, key):
+		return key in self._values
+
+	def set(self, key, value):
+		self._values[key] = value
+
+	def erase(self, key):
+		self._values.pop(key, None)
+
+
+class Selection:
+	'''A stand-in for sublime.Selection: the regions selected in a TextBuffer, in order.'''
+	def __init__(self):
+		self._regions = []
+
+	def __len__(self):
+		return len(self._regions)
+
+	def __iter__(self):
+		return iter(self._regions)
+
+	def __getitem__(self, i):
+		return self._regions[i]
+
+	def clear(self):
+		self._regions = []
+
+	def add(self, x):
+		self.add_all([x])
+
+	def add_all(self, regions):
+		'''Adds the given regions or points, merging any that overlap, as Sublime Text does.
+
+		Regions that only touch are kept separate.'''
+		regions = self._regions + [Region(x) if isinstance(x, int) else x for x in regions]
+		regions.sort(key=lambda r: (r.begin(), r.end()))
+		merged = []
+		for region in regions:
+			if len(merged) > 0:
+				last = merged[-1]
+				if region.begin() < last.end() or (region.a == last.a and region.b == last.b):
+					merged[-1] = last.cover(region)
+					continue
+			merged.append(region)
+		self._regions = merged
+
+
+class TextBuffer:
+	'''Text held in memory, with the parts of the sublime.View API that TabNav's table engine uses,
+	so that a TableView and TableNavigator can work on plain strings and files outside of Sublime Text.
+
+	All of the text has the single given scope, against which selectors are matched, and all of it is
+	visible. Each TextBuffer has its own buffer ID. Its cached rows are discarded whenever its text is
+	replaced, and should be cleared with clear_row_caches when the TextBuffer is no longer needed.'''
+	def __init__(self, text='', scope='text.plain', settings=None):
+		self._id = next(_buffer_ids)
+		self._scope = scope
+		self._settings = Settings(settings)
+		self._selection = Selection()
+		self._change_count = 0
+		self._set_text(text)
+
+	@classmethod
+	def from_file(cls, path, scope='text.plain', settings=None):
+		'''Creates a TextBuffer with the contents of the given UTF-8 file, with its line endings normalized.'''
+		with open(path, encoding='utf-8', newline='') as f:
+			text = f.read()
+		return cls(text.replace('\r\n', '\n').replace('\r', '\n'), scope, settings)
+
+	def _set_text(self, text):
+		self._text = text
+		lines = text.split('\n')
+		self._line_starts = [0]
+		self._line_starts.extend(accumulate(len(line) + 1 for line in lines[:-1]))
+
+	def replace(self, region, text):
+		'''Replaces the text of the region with the given text.'''
+		self._set_text(self._text[:region.begin()] + text + self._text[region.end():])
+		self._change_count = self._change_count + 1
+
+	def id(self):
+		return self._id
+
+	def buffer_id(self):
+		return self._id
+
+	def change_count(self):
+		return self._change_count
+
+	def size(self):
+		return len(self._text)
+
+	def settings(self):
+		return self._settings
+
+	def sel(self):
+		return self._selection
+
+	def visible_region(self):
+		return Region(0, len(self._text))
+
+	def substr(self, x):
+		if isinstance(x, Region):
+			return self._text[x.begin():x.end()]
+		if 0 <= x < len(self._text):
+			return self._text[x]
+		return '\x00'
+
+	def rowcol(self, point):
+		point = max(0, min(point, len(self._text)))
+		row = bisect.bisect_right(self._line_starts, point) - 1
+		return (row, point - self._line_starts[row])
+
+	def text_point(self, row, col):
+		'''Gets the point at the row and column, or the end of the text if the row is beyond the last line.'''
+		if row < 0:
+			return 0
+		if row >= len(self._line_starts):
+			return len(self._text)
+		return min(self._line_starts[row] + col, len(self._text))
+
+	def line(self, x):
+		'''Gets the region of the lines that include the given point or region, excluding the final newline.'''
+		if isinstance(x, Region):
+			begin, end = x.begin(), x.end()
+		else:
+			begin = end = x
+		first_row = self.rowcol(begin)[0]
+		last_row = self.rowcol(end)[0]
+		if last_row + 1 < len(self._line_starts):
+			line_end = self._line_starts[last_row + 1] - 1
+		else:
+			line_end = len(self._text)
+		return Region(self._line_starts[first_row], line_end)
+
+	def split_by_newlines(self, region):
+		'''Splits the region into the parts of it on each line.'''
+		begin, end = region.begin(), region.end()
+		if begin == end:
+			return [Region(begin, end)]
+		regions = []
+		for row in range(self.rowcol(begin)[0], self.rowcol(end)[0] + 1):
+			line = self.line(self._line_starts[row])
+			part = Region(max(line.a, begin), min(line.b, end))
+			if not part.empty():
+				regions.append(part)
+		return regions if len(regions) > 0 else [Region(begin, end)]
+
+	def scope_name(self, point):
+		return self._scope + ' '
+
+	def score_selector(self, point, selector):
+		'''Scores the selector against the buffer's scope.
+
+		This is a simplified version of Sublime Text's scoring: each of the selector's alternatives matches
+		if all of its space-separated scopes are prefixes of the buffer's scopes, in order, and scores
+		the total number of their dot-separated parts. Exclusions with '-' are supported.'''
+		scopes = self._scope.split()
+		best = 0
+		for alternative in re.split(r'[,|]', selector):
+			included, *excluded = alternative.split(' - ')
+			score = _score_scopes(scopes, included.split())
+			if score > 0 and not any(_score_scopes(scopes, e.split()) > 0 for e in excluded):
+				best = max(best, score)
+		return best
+
+	def find_by_selector(self, selector):
+		if self.score_selector(0, selector) > 0:
+			return [Region(0, len(self._text))]
+		return []
+
+
+def _score_scopes(scopes, selector_scopes):
+	'''Scores the space-separated scopes of a selector, which must each prefix one of the scopes, in order.'''
+	if len(selector_scopes) == 0:
+		return 0
+	score = 0
+	i = 0
+	for selector_scope in selector_scopes:
+		while i < len(scopes) and not (scopes[i] == selector_scope or scopes[i].startswith(selector_scope + '.')):
+			i = i + 1
+		if i == len(scopes):
+			return 0
+		score = score + selector_scope.count('.') + 1
+		i = i + 1
+	return score
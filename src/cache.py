@@ -0,0 +1,320 @@
+from TabNav.src.extents import TableExtents
+from TabNav.src.records import RecordIndex
+from TabNav.src.util import get_logger
+import bisect
+import threading
+
+log = get_logger(__package__, __name__)
+
+_buffer_caches = {} # keyed by buffer ID
+# Held while rows are parsed into, or changes are applied to, the caches, since rows are also parsed in the background
+row_cache_lock = threading.RLock()
+
+# Inserting any of these characters can change the scopes of the lines after it, such as by opening a fenced code block
+_scope_characters = frozenset('\n`~#+|<>')
+# RowMaps with at most this many of their own rows are moved by an edit right away, rather than when the rows are next read
+_eager_move_rows = 1024
+# The most RowMaps that are chained behind the current one. Rows cached before that are discarded.
+_max_generations = 8
+
+
+class RowMap(dict):
+	'''The parsing results of one context and cell direction, keyed by row.
+
+	So that an edit doesn't have to re-key and shift every cached row, the rows cached before
+	an edit are left in an older RowMap, keyed by their rows at the time. Each run of rows that
+	the edits didn't touch is stored as (first_row, last_row, row_delta, point_delta), and a row
+	is only moved into this RowMap, and shifted, when it is next read. Rows that aren't in any run,
+	such as the edited lines, are never read from the older RowMap.'''
+	def __init__(self):
+		super().__init__()
+		self._older = None
+		self._runs = []
+		self._run_starts = []
+		self._generations = 0
+
+	def __missing__(self, r):
+		row = self._take_older(r, True)
+		if row is None:
+			raise KeyError(r)
+		return row
+
+	def __contains__(self, r):
+		return dict.__contains__(self, r) or self._take_older(r, True) is not None
+
+	def _take(self, r):
+		'''Removes and returns the result of row r from this RowMap or the older ones, or returns None.'''
+		row = self.pop(r, None)
+		if row is None:
+			row = self._take_older(r, False)
+		return row
+
+	def _take_older(self, r, keep):
+		'''Takes the result of row r from the older RowMap, shifted to row r, and keeps it in this RowMap if keep is True.'''
+		if self._older is None:
+			return None
+		i = bisect.bisect_right(self._run_starts, r) - 1
+		if i < 0:
+			return None
+		first_row, last_row, row_delta, point_delta = self._runs[i]
+		if r > last_row:
+			return None
+		row = self._older._take(r - row_delta)
+		if row is None:
+			return None
+		if not isinstance(row, type) and (row_delta != 0 or point_delta != 0):
+			row.shift(row_delta, point_delta)
+		if keep:
+			dict.__setitem__(self, r, row)
+		return row
+
+	def moved(self, first_row, last_row, row_delta, point_delta, discard_after=False):
+		'''Gets a RowMap of these results after an edit that replaced the lines from first_row to last_row.
+
+		The rows after the edit are moved by row_delta rows and point_delta points, unless discard_after
+		is True, in which case they are discarded along with the edited rows.'''
+		rows = RowMap()
+		if len(self) <= _eager_move_rows:
+			for r, row in self.items():
+				if r < first_row:
+					dict.__setitem__(rows, r, row)
+				elif r > last_row and not discard_after:
+					if not isinstance(row, type):
+						row.shift(row_delta, point_delta)
+					dict.__setitem__(rows, r + row_delta, row)
+			older = self._older
+			runs = self._runs
+			generations = self._generations
+		else:
+			older = self
+			runs = [(0, float('inf'), 0, 0)]
+			generations = self._generations + 1
+		if older is not None and generations <= _max_generations:
+			rows._older = older
+			rows._generations = generations
+			rows._runs = _moved_runs(runs, first_row, last_row, row_delta, point_delta, discard_after)
+			rows._run_starts = [run[0] for run in rows._runs]
+		return rows
+
+
+def _moved_runs(runs, first_row, last_row, row_delta, point_delta, discard_after):
+	'''Gets the runs of rows that are still read from an older RowMap after an edit of the lines from first_row to last_row.'''
+	moved = []
+	for run_first, run_last, run_row_delta, run_point_delta in runs:
+		if run_first < first_row:
+			moved.append((run_first, min(run_last, first_row - 1), run_row_delta, run_point_delta))
+		if run_last > last_row and not discard_after:
+			run_first = max(run_first, last_row + 1)
+			moved.append((run_first + row_delta, run_last + row_delta, run_row_delta + row_delta, run_point_delta + point_delta))
+	return moved
+
+
+def _may_change_scopes(change):
+	'''Checks whether a change could change the scopes of the lines after it.
+
+	The removed text isn't known, so any removal could.'''
+	return change.b.pt > change.a.pt or any(c in _scope_characters for c in change.str)
+
+
+class RowCache:
+	'''Stores the parsing results for the rows of a single buffer.
+
+	Results are stored separately for each TabnavContext and cell direction, since both
+	affect the TableCells that are built for a row. All results are only valid for
+	the buffer's change count at the time the cache was created.
+
+	The TableExtents of each selector, and the ColumnSkipIndexes of each context's tables,
+	are also stored. The ColumnSkipIndexes of the tables that a change could affect are discarded,
+	and the TableExtents are discarded on any change that could change the view's scopes.
+
+	For contexts whose rows are CSV records that can span multiple lines, the RecordIndex of the
+	buffer is stored as well, and is updated incrementally.
+
+	The buffer's size at that change count is also stored, to check that the changes applied to the
+	cache bring it to the same state as the buffer.
+	'''
+	def __init__(self, change_count, size):
+		self.change_count = change_count
+		self.size = size
+		self._entries = {}
+		self._extents = {}
+		self._skip_indexes = {}
+		self._records = {} # RecordIndexes, keyed by (maximum record length, delimiter)
+		self._record_entries = {} # the RecordIndex key of the entries whose rows are records
+		self._scoped_entries = set() # the entries whose rows must match a selector
+
+	def rows(self, context_key, cell_direction, records_key=None, scoped=False):
+		'''Gets the RowMap of parsing results for the given context and cell direction.
+
+		Values are either a TableRow, or the exception class that was raised when
+		attempting to parse the row. If the rows are records, every line of a record
+		has the same value.'''
+		key = (context_key, cell_direction)
+		rows = self._entries.get(key)
+		if rows is None:
+			rows = RowMap()
+			self._entries[key] = rows
+			if records_key is not None:
+				self._record_entries[key] = records_key
+			if scoped:
+				self._scoped_entries.add(key)
+		return rows
+
+	def records(self, max_lines, delimiter):
+		'''Gets the RecordIndex of the buffer for the given maximum record length and regex-escaped delimiter.'''
+		key = (max_lines, delimiter)
+		records = self._records.get(key)
+		if records is None:
+			records = RecordIndex(max_lines, delimiter, row_cache_lock)
+			self._records[key] = records
+		return records
+
+	def extents(self, view, selector, except_selector):
+		'''Gets the TableExtents of the given selectors, finding them in the view if necessary.
+
+		The lock isn't held while finding them, so they're only cached if the buffer didn't change meanwhile.'''
+		key = (selector, except_selector)
+		extents = self._extents.get(key)
+		if extents is None:
+			change_count = self.change_count
+			extents = TableExtents(view, selector, except_selector)
+			with row_cache_lock:
+				if self.change_count == change_count:
+					extents = self._extents.setdefault(key, extents)
+		return extents
+
+	def skip_indexes(self, context_key):
+		'''Gets the list of ColumnSkipIndexes built for the tables of the given context.'''
+		indexes = self._skip_indexes.get(context_key)
+		if indexes is None:
+			indexes = []
+			self._skip_indexes[context_key] = indexes
+		return indexes
+
+	def apply_text_change(self, change):
+		'''Updates the cached rows to account for a single modification of the buffer.
+
+		Rows spanned by the change are discarded, to be re-parsed when next needed.
+		Rows after the change are moved by the number of lines inserted or removed,
+		and their cells are shifted by the number of characters inserted or removed,
+		when they are next read.
+
+		If the change could change the scopes of the lines after it, the rows after it
+		are discarded from the contexts with a selector, and the TableExtents are discarded.
+		Otherwise, the TableExtents are shifted along with the rows. Any change can move the boundaries
+		of all of the records after it, so records are discarded from the start of the
+		first record spanned by the change. Only the ColumnSkipIndexes of tables that end
+		before the line preceding the change are kept.'''
+		first_row = change.a.row
+		last_row = change.b.row
+		row_delta = change.str.count('\n') - (last_row - first_row)
+		point_delta = len(change.str) - (change.b.pt - change.a.pt)
+		self.size = self.size + point_delta
+		scopes_changed = _may_change_scopes(change)
+		if scopes_changed:
+			self._extents.clear()
+		else:
+			for extents in self._extents.values():
+				extents.shift(change.a.pt, point_delta)
+		first_records = {}
+		for records_key, records in self._records.items():
+			first_records[records_key] = records.record_start(first_row)
+			records.truncate(first_row)
+		# A table that ends on the line before the change could be extended by it
+		first_changed_row = min([first_row] + list(first_records.values()))
+		for context_key, indexes in self._skip_indexes.items():
+			self._skip_indexes[context_key] = [index for index in indexes if index.last_row < first_changed_row - 1]
+		for key, rows in self._entries.items():
+			records_key = self._record_entries.get(key)
+			if records_key is not None:
+				first_record = first_records.get(records_key, first_row)
+				self._entries[key] = rows.moved(first_record, last_row, row_delta, point_delta, True)
+			else:
+				discard_after = scopes_changed and key in self._scoped_entries
+				self._entries[key] = rows.moved(first_row, last_row, row_delta, point_delta, discard_after)
+
+
+def _get_buffer_cache(view):
+	'''Gets the RowCache of the view's buffer, discarding it if the buffer's change count
+	differs from that of the cached results.'''
+	buffer_id = view.buffer_id()
+	change_count = view.change_count()
+	with row_cache_lock:
+		cache = _buffer_caches.get(buffer_id)
+		if cache is None or cache.change_count != change_count:
+			cache = RowCache(change_count, view.size())
+			_buffer_caches[buffer_id] = cache
+	return cache
+
+
+def is_row_cache_current(view, change_count):
+	'''Checks that the view is still at the given change count, and that its buffer's cache, if any,
+	has been updated with all of the changes up to it.
+
+	Unlike getting the cache, this never discards a cache that is behind the view, which is
+	normal while a change is still being applied.'''
+	if view.change_count() != change_count:
+		return False
+	cache = _buffer_caches.get(view.buffer_id())
+	return cache is None or cache.change_count == change_count
+
+
+def get_row_cache(view, context, cell_direction):
+	'''Gets the persistent parsing results for the given view, context and cell direction.'''
+	records_key = None if context.max_record_lines is None else (context.max_record_lines, context.record_delimiter)
+	return _get_buffer_cache(view).rows(context.key, cell_direction, records_key, context.selector is not None)
+
+
+def get_record_index(view, context):
+	'''Gets the persistent RecordIndex of the view, if the context's rows are CSV records that can span multiple lines.
+
+	Returns None if each of the context's rows is a single line.'''
+	if context.max_record_lines is None:
+		return None
+	return _get_buffer_cache(view).records(context.max_record_lines, context.record_delimiter)
+
+
+def get_skip_indexes(view, context):
+	'''Gets the persistent list of ColumnSkipIndexes built for the given context's tables in the view.'''
+	return _get_buffer_cache(view).skip_indexes(context.key)
+
+
+def get_table_extents(view, context):
+	'''Gets the persistent TableExtents of the given context's selectors in the view.
+
+	Returns None if the context has no selector.'''
+	if context.selector is None:
+		return None
+	return _get_buffer_cache(view).extents(view, context.selector, context.except_selector)
+
+
+def update_row_cache(buffer_id, changes, change_count, size):
+	'''Applies the given text changes to the buffer's cached rows, if any.
+
+	The buffer's change count and size are given as they were when the changes were reported. If the cache
+	was already built against that change count, the changes are already reflected in it, and are ignored.
+	If the buffer has been changed again since these changes, the later changes would be taken as already
+	applied, so the cache is discarded instead. That's the case if the change count moved by more than one
+	per change, or if the changes don't account for the buffer's size.'''
+	with row_cache_lock:
+		cache = _buffer_caches.get(buffer_id)
+		if cache is None or cache.change_count == change_count:
+			return
+		if not 0 < change_count - cache.change_count <= len(changes) \
+			or cache.size + sum(len(change.str) - (change.b.pt - change.a.pt) for change in changes) != size:
+			log.debug("Buffer %s changed again since the changes were made; discarding its cached rows", buffer_id)
+			del _buffer_caches[buffer_id]
+			return
+		for change in changes:
+			cache.apply_text_change(change)
+		cache.change_count = change_count
+
+
+def clear_row_caches(buffer_id=None):
+	'''Discards the cached rows of the given buffer, or of all buffers if no buffer ID is given.'''
+	with row_cache_lock:
+		if buffer_id is None:
+			log.debug("Clearing all cached rows")
+			_buffer_caches.clear()
+		else:
+			_buffer_caches.pop(buffer_id, None)
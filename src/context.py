@@ -1,20 +1,57 @@
+from TabNav.src.buffer import Region, load_settings
 from TabNav.src.enum import capture_levels
-from TabNav.src.parsing import RowParser
+from TabNav.src.parsing import RowParser, compile_line_classifier
+from TabNav.src.sniffer import sniff_delimiter
+from TabNav.src.stats import timed
+from TabNav.src.table import TableRow
+from TabNav.src.tokenizer import compile_csv_tokenizer
 from TabNav.src.util import get_logger, get_merged_context_configs, score_tabnav_selectors
 import itertools
 import re
-import sublime
+import zlib
 
 log = get_logger(__package__, __name__)
 
+_context_configs = None # The merged context configurations from the package settings
+_default_capture_level = None # The global capture level from the package settings
+_default_line_limits = None # The global (max_line_length, max_cells) from the package settings
+_default_large_file = None # The global (large_file_size, large_file_margin) from the package settings
+_contexts = {} # Previously built TabnavContexts, keyed by (context key, capture level, delimiter)
+_sniffed_delimiters = {} # (change count, checksum of the sampled lines, auto delimiters, delimiter), keyed by buffer ID
+
+
+def reload_contexts():
+	'''Reloads the context configurations from the package settings.
+
+	All previously built TabnavContext objects are discarded. This should be called whenever
+	the package settings change.'''
+	global _context_configs, _default_capture_level, _default_line_limits, _default_large_file
+	settings = load_settings("tabnav.sublime-settings")
+	_context_configs = get_merged_context_configs()
+	_default_capture_level = settings.get("capture_level", "content")
+	_default_line_limits = (settings.get("max_line_length", 20000), settings.get("max_cells", 1000))
+	_default_large_file = (settings.get("large_file_size", 10000000), settings.get("large_file_margin", 2000))
+	_contexts.clear()
+	log.debug("Reloaded context configurations: %s", list(_context_configs.keys()))
+
+
+def get_context_configs():
+	'''Gets the merged context configurations, loading them on first use.'''
+	if _context_configs is None:
+		reload_contexts()
+	return _context_configs
+
 
 def get_current_context(view, context_key=None, capture_level=None):
-	'''Attempts to identify the current context and build the corresponding TabnavContext object.
+	'''Attempts to identify the current context and get the corresponding TabnavContext object.
 
 	If a particular context_key is provided, it is the only context configured. If no key is provided,
 	all contexts in the configuration are checked.
+
+	TabnavContext objects are only built once for each combination of context, capture level
+	and CSV delimiter, and are then re-used until the package settings change.
 	'''
-	context_configs = get_merged_context_configs(context_key)
+	context_configs = get_context_configs()
 	if context_key is None:
 		context_key, score = _get_context_by_config_selector(view, context_configs)
 		if score < 0:
@@ -34,15 +71,39 @@ def get_current_context(view, context_key=None, capture_level=None):
 			log.debug("Context '%s' requires that TabNav be explicitly enabled.", context_key)
 			return None
 	if context_key == "auto_csv":
-		context = _get_auto_csv_table_config(view, context_config)
+		delimiter = _get_auto_csv_delimiter(view, context_config)
+		if delimiter is None:
+			return None
 	else:
 		log.debug("Using tabnav context '%s'", context_key)
-		patterns = context_config.get('patterns', None)
-		capture_level = _get_current_capture_level(view, context_config)
-		context = TabnavContext(patterns, capture_level)
-	if context is not None:
-		context._selector = context_config.get('selector', None)
-		context._except_selector = context_config.get('except_selector', None)
+		delimiter = None
+	capture_level = _get_current_capture_level(view, context_config)
+	registry_key = (context_key, capture_level, delimiter)
+	context = _contexts.get(registry_key)
+	if context is None:
+		context = _build_context(context_config, capture_level, delimiter)
+		_contexts[registry_key] = context
+	return context
+
+
+def _build_context(context_config, capture_level, delimiter=None):
+	patterns = context_config.get('patterns', None)
+	if delimiter is not None:
+		patterns = _format_csv_patterns(patterns, delimiter)
+	max_line_length = context_config.get('max_line_length', _default_line_limits[0])
+	max_cells = context_config.get('max_cells', _default_line_limits[1])
+	context = TabnavContext(patterns, capture_level, max_line_length, max_cells)
+	context._selector = context_config.get('selector', None)
+	context._except_selector = context_config.get('except_selector', None)
+	context._large_file_size = context_config.get('large_file_size', _default_large_file[0])
+	context._large_file_margin = context_config.get('large_file_margin', _default_large_file[1])
+	if delimiter is not None and context_config.get('fast_tokenizer', True):
+		context._tokenizer = compile_csv_tokenizer(context_config.get('patterns', None), delimiter, context.capture_level, max_cells)
+	if delimiter is not None:
+		max_record_lines = context_config.get('max_record_lines', 1)
+		if max_record_lines is not None and max_record_lines > 1:
+			context._max_record_lines = max_record_lines
+			context._record_delimiter = delimiter
 	return context
 
 
@@ -78,7 +139,8 @@ _escaped_delimiters = {
 }
 
 
-def _get_auto_csv_table_config(view, context_config):
+def _get_auto_csv_delimiter(view, context_config):
+	'''Determines the regex-escaped delimiter to use for the auto_csv context.'''
 	point = view.sel()[0].a
 	scope = view.scope_name(point)
 	delimiter = None
@@ -96,30 +158,60 @@ def _get_auto_csv_table_config(view, context_config):
 	if delimiter is None:
 		delimiter = view.settings().get('tabnav.delimiter')
 	if delimiter is None:
-		line = view.substr(view.line(0))
-		auto_delimiters = context_config.get('auto_delimiters', [r',', r';', r'\t', r'\|'])
-		matches = [d for d in auto_delimiters if re.search(d, line) is not None]
-		if len(matches) == 1:
-			# If we hit on exactly one delimiter, then we'll assume it's the one to use
-			delimiter = matches[0]
-			log.debug("Inferred delimiter: %s", delimiter)
-		else:
-			log.debug('Not exactly one auto delimiter matched: %s.', matches)
+		delimiter = _get_sniffed_delimiter(view, context_config)
 	if delimiter is None:
 		delimiter = context_config.get("default_delimiter", None)
 	if delimiter is None:
 		return None
 	delimiter = _escaped_delimiters.get(delimiter, delimiter)
 	log.debug("Using 'auto_csv' context with delimiter '%s'", delimiter)
-	patterns = context_config['patterns']
+	return delimiter
+
+
+def _get_sniffed_delimiter(view, context_config):
+	'''Infers the delimiter from a sample of the first lines of the view.
+
+	The result is cached for the view's buffer, along with a checksum of the sampled lines, and is only
+	inferred again once the sampled lines change. It isn't stored in the view's settings, since this is
+	called while checking key binding contexts, and changing a setting would notify its listeners.'''
+	buffer_id = view.buffer_id()
+	change_count = view.change_count()
+	sniffed = _sniffed_delimiters.get(buffer_id)
+	if sniffed is not None and sniffed[0] == change_count:
+		return sniffed[3]
+	auto_delimiters = context_config.get('auto_delimiters', [r',', r';', r'\t', r'\|'])
+	sample_lines = max(context_config.get('auto_delimiter_sample_lines', 20), 1)
+	sample = view.substr(Region(0, view.line(view.text_point(sample_lines - 1, 0)).end()))
+	checksum = zlib.crc32(sample.encode('utf-8'))
+	if sniffed is None or sniffed[1:3] != (checksum, auto_delimiters):
+		delimiter = sniff_delimiter(sample.split('\n'), auto_delimiters)
+		log.debug("Inferred delimiter: %s", delimiter)
+	else:
+		delimiter = sniffed[3]
+	_sniffed_delimiters[buffer_id] = (change_count, checksum, auto_delimiters, delimiter)
+	return delimiter
+
+
+def clear_sniffed_delimiters(buffer_id=None):
+	'''Discards the inferred delimiter of the given buffer, or of all buffers if no buffer ID is given.'''
+	if buffer_id is None:
+		_sniffed_delimiters.clear()
+	else:
+		_sniffed_delimiters.pop(buffer_id, None)
+
+
+def _format_csv_patterns(patterns, delimiter):
+	'''Formats the delimiter into copies of the given CSV patterns.'''
 	if isinstance(patterns, dict):
 		patterns = [patterns]
+	formatted = []
 	for pattern_set in patterns:
+		pattern_set = dict(pattern_set)
 		if 'line' in pattern_set:
 			pattern_set['line'] = pattern_set['line'].format(delimiter)
 		pattern_set['cell'] = [p.format(delimiter) for p in pattern_set['cell']]
-	capture_level = _get_current_capture_level(view, context_config)
-	return TabnavContext(patterns, capture_level)
+		formatted.append(pattern_set)
+	return formatted
 
 
 def _get_current_capture_level(view, context_config):
@@ -127,29 +219,78 @@ def _get_current_capture_level(view, context_config):
 	if capture_level is None:
 		capture_level = context_config.get('capture_level', None)
 	if capture_level is None:
-		settings = sublime.load_settings("tabnav.sublime-settings")
-		capture_level = settings.get("capture_level", "content")
+		capture_level = _default_capture_level
 	return capture_level
 
 
+def _pattern_set_key(pattern_set):
+	cells = pattern_set.get('cell')
+	if isinstance(cells, list):
+		cells = tuple(cells)
+	return (pattern_set.get('line'), cells)
+
+
 class TabnavContext:
 	'''Contains information about the current context of the view.
 
 	Contexts are defined in the settings files. The auto_csv context is a special case
 	for which additional work is done to try to identify the CSV delimiter to use.
+
+	Lines longer than max_line_length, or with more than max_cells cells, aren't parsed as table rows,
+	so that a single pathological line can't stall the parsing of every keystroke.
 	'''
-	def __init__(self, patterns, capture_level):
+	def __init__(self, patterns, capture_level, max_line_length=None, max_cells=None):
 		self._capture_level = capture_levels[capture_level][0]
 		included_levels = reversed([(k,v[0]) for k,v in capture_levels.items() if v[0] <= self._capture_level]) # reversed because we try to capture the closest match first
 		excluded_levels = ((k,v[0]) for k,v in capture_levels.items() if v[0] > self._capture_level)
 		ordered_levels = list(itertools.chain(included_levels, excluded_levels))
 		if isinstance(patterns, dict):
-			patterns = [content_patterns]
-		self._parsers = [RowParser(p.get('cell'), p.get('line'), ordered_levels) for p in patterns]
-	
+			patterns = [patterns]
+		self._parsers = [RowParser(p.get('cell'), p.get('line'), ordered_levels, max_cells) for p in patterns]
+		self._classifier = compile_line_classifier(self._parsers)
+		self._patterns_key = (self._capture_level, tuple(_pattern_set_key(p) for p in patterns), max_line_length, max_cells)
+		self._max_line_length = max_line_length
+		self._selector = None
+		self._except_selector = None
+		self._tokenizer = None
+		self._max_record_lines = None # only set for CSV contexts, whose quoted fields can contain newlines
+		self._record_delimiter = None
+		self._large_file_size = None
+		self._large_file_margin = 0
+
+	@property
+	def key(self):
+		'''A hashable value that identifies contexts that parse rows identically.'''
+		return (self._patterns_key, self._selector, self._except_selector, self._max_record_lines)
+
 	@property
 	def parsers(self):
 		return self._parsers
+
+	@timed('parse_row')
+	def parse_row(self, line_content, row, line_start_point, cell_direction=1):
+		'''Parses the line with the first of the context's parsers that matches it, or returns None if none do.
+
+		Lines longer than the maximum line length are only parsed if the context has a tokenizer,
+		which splits them without the risk of regex backtracking.'''
+		if self._tokenizer is not None:
+			cell_data = self._tokenizer.tokenize(line_content)
+			if cell_data is None:
+				log.debug("Line %d has more than the maximum number of cells, and is not parsed.", row+1)
+				return None
+			if len(cell_data) == 0:
+				return None
+			return TableRow(row, line_start_point, cell_data, cell_direction)
+		if self._max_line_length is not None and len(line_content) > self._max_line_length:
+			log.debug("Line %d is longer than %d characters, and is not parsed.", row+1, self._max_line_length)
+			return None
+		if self._classifier is not None:
+			return self._classifier.parse_row(line_content, row, line_start_point, cell_direction)
+		for parser in self._parsers:
+			table_row = parser.parse_row(line_content, row, line_start_point, cell_direction)
+			if table_row is not None:
+				return table_row
+		return None
 	
 	@property
 	def selector(self):
@@ -161,4 +302,25 @@ class TabnavContext:
 
 	@property
 	def capture_level(self):
-		return self._capture_level
\ No newline at end of file
+		return self._capture_level
+
+	@property
+	def large_file_size(self):
+		'''The number of characters above which a view is a large file, or None if no view is.'''
+		return self._large_file_size
+
+	@property
+	def large_file_margin(self):
+		'''The number of rows past the visible region and the selections to which whole-table operations
+		are limited in a large file.'''
+		return self._large_file_margin
+
+	@property
+	def max_record_lines(self):
+		'''The maximum number of lines in a CSV record, or None if each row is a single line.'''
+		return self._max_record_lines
+
+	@property
+	def record_delimiter(self):
+		'''The regex-escaped delimiter between the fields of CSV records, or None if each row is a single line.'''
+		return self._record_delimiter
\ No newline at end of file
@@ -21,4 +21,10 @@ class RowOutOfFileBounds(Exception):
 class CursorNotInTableError(Exception):
 	def __init__(self, cursor):
 		self.cursor = cursor
-		self.err = "Cursor at position {0} is not within a table.".format(cursor)
\ No newline at end of file
+		self.err = "Cursor at position {0} is not within a table.".format(cursor)
+
+class ColumnNameNotFoundError(Exception):
+	def __init__(self, name):
+		self.name = name
+		self.err = "The table doesn't have a column named '{0}'.".format(name)
+		super().__init__(self.err)
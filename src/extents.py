@@ -0,0 +1,93 @@
+from TabNav.src.util import get_logger
+import bisect
+
+log = get_logger(__package__, __name__)
+
+# Results of TableExtents.classify
+OUTSIDE = 0
+INSIDE = 1
+AMBIGUOUS = 2
+
+
+class _Regions:
+	'''A sorted, non-overlapping list of regions that can be searched by point.'''
+	def __init__(self, regions):
+		self._begins = [r.begin() for r in regions]
+		self._ends = [r.end() for r in regions]
+
+	def __len__(self):
+		return len(self._begins)
+
+	def index(self, point):
+		'''Gets the index of the region that contains the given point, or -1 if none does.'''
+		i = bisect.bisect_right(self._begins, point) - 1
+		if i >= 0 and point < self._ends[i]:
+			return i
+		return -1
+
+	def bounds(self, i):
+		return self._begins[i], self._ends[i]
+
+	def shift(self, point, point_delta):
+		'''Moves the regions for point_delta characters inserted at the given point.'''
+		i = bisect.bisect_right(self._begins, point)
+		self._begins[i:] = [begin + point_delta for begin in self._begins[i:]]
+		i = bisect.bisect_right(self._ends, point)
+		self._ends[i:] = [end + point_delta for end in self._ends[i:]]
+
+
+class TableExtents:
+	'''Identifies the parts of a view that are matched by a context's selector.
+
+	The extents are found with a single find_by_selector call for each of the selector and the
+	except_selector. Rows that start within the selector's regions, but not the except_selector's,
+	are eligible to be table rows without scoring the selectors at each row. Edits that can't change
+	any scopes only move the regions, so the extents are shifted rather than found again.
+	'''
+	def __init__(self, view, selector, except_selector):
+		self._selector = selector
+		self._except_selector = except_selector
+		self._regions = _Regions(view.find_by_selector(selector))
+		if except_selector is not None:
+			self._except_regions = _Regions(view.find_by_selector(except_selector))
+		else:
+			self._except_regions = _Regions([])
+		self._row_bounds = {}
+		log.debug("Found %d regions matching selector '%s'", len(self._regions), selector)
+
+	def classify(self, point):
+		'''Determines whether a row starting at the given point is within the selector.
+
+		Returns OUTSIDE if the selector doesn't match the point, INSIDE if only the selector matches,
+		or AMBIGUOUS if both the selector and except_selector match, in which case the selectors must
+		be scored to determine which takes precedence.'''
+		if self._regions.index(point) < 0:
+			return OUTSIDE
+		if self._except_regions.index(point) < 0:
+			return INSIDE
+		return AMBIGUOUS
+
+	def shift(self, point, point_delta):
+		'''Moves the extents for point_delta characters, not including any newlines, inserted at the given point.'''
+		self._regions.shift(point, point_delta)
+		self._except_regions.shift(point, point_delta)
+
+	def row_bounds(self, view, point):
+		'''Gets the first and last rows that start within the selector region containing the given point.
+
+		Returns None if the point isn't within the selector, or if the region spans the whole view, since it then
+		doesn't bound any table. This is the case for selectors that match the whole document, such as Markdown's.'''
+		i = self._regions.index(point)
+		if i < 0:
+			return None
+		if i not in self._row_bounds:
+			begin, end = self._regions.bounds(i)
+			first_row, col = view.rowcol(begin)
+			if col > 0:
+				first_row = first_row + 1
+			last_row = view.rowcol(end - 1)[0]
+			if first_row == 0 and last_row >= view.rowcol(max(view.size() - 1, 0))[0]:
+				self._row_bounds[i] = None
+			else:
+				self._row_bounds[i] = (first_row, last_row)
+		return self._row_bounds[i]
@@ -1,8 +1,9 @@
+from TabNav.src.buffer import Region
 from TabNav.src.util import get_logger, point_from_region_func
 from TabNav.src.exceptions import *
-from TabNav.src.table import TableColumn
+from TabNav.src.stats import timed
+from TabNav.src.table import TableColumn, TableColumnIndex
 import itertools
-import sublime
 
 log = get_logger(__package__, __name__)
 
@@ -21,6 +22,7 @@ class TableNavigator:
 	def view(self):
 		return self._table.view
 
+	@timed('split_selections')
 	def split_selections(self, select=True, capture_level=None, move_cursors=False, expand_selections=True):
 		if capture_level is None:
 			capture_level = self.capture_level
@@ -29,6 +31,14 @@ class TableNavigator:
 		else:
 			return self._split_selections_into_cursors(capture_level, move_cursors)
 
+	def _split_multiline_region(self, region, rows):
+		'''Splits the region by newlines, given the first and last rows that it spans.'''
+		first_row, last_row = rows
+		if self._table.spans_one_row(first_row, last_row):
+			# A region within a single line, or a single multi-line CSV record, is never split
+			return [region]
+		return self._split_by_newlines_if_necessary(region)
+
 	def _split_by_newlines_if_necessary(self, region):
 		'''Splits by newlines only if the region spans more than one line.
 
@@ -52,14 +62,13 @@ class TableNavigator:
 		Returns True if the selections changed, or False otherwise.
 		'''
 		selections = list(self.view.sel())
-		selection_lines = list(itertools.chain.from_iterable((self._split_by_newlines_if_necessary(r) for r in selections)))
+		selection_lines = list(itertools.chain.from_iterable((self._split_multiline_region(region, rows) for region, rows in zip(selections, self._table.region_rows(selections)))))
 		selection_changed = len(selection_lines) != len(selections)
 		cells_by_level = {}
-		for region in selection_lines:
-			point = self._point_from_region(region)
-			r = self.view.rowcol(point)[0]
+		points = [self._point_from_region(region) for region in selection_lines]
+		for region, point, r in zip(selection_lines, points, self._table.rows_at_points(points)):
 			row = self._table[r]
-			line_cells = list(cell for cell in row if cell.intersects(region, full_extent=False))
+			line_cells = row.intersecting_cells(region.begin(), region.end(), full_extent=False)
 			if len(line_cells) == 0:
 				if len(row) > 0:
 					# This happens if the cursor is immediately after the final pipe in a Markdown table and there are no further characters, for example
@@ -114,8 +123,13 @@ class TableNavigator:
 		'''
 		lines = []
 		selection_changed = False
-		for sel in self.view.sel():
-			l = self.view.split_by_newlines(sel)
+		selections = list(self.view.sel())
+		for sel, (first_row, last_row) in zip(selections, self._table.region_rows(selections)):
+			if self._table.spans_one_row(first_row, last_row):
+				# A region within a single line, or a single multi-line CSV record, is never split
+				l = [sel]
+			else:
+				l = self.view.split_by_newlines(sel)
 			if len(l) > 1:
 				lines.extend(l)
 				selection_changed = True
@@ -125,11 +139,10 @@ class TableNavigator:
 				# right, and the current selection is a cell selected in reverse.)
 				lines.append(sel)
 		cursors_by_level = {}
-		for region in lines:
-			point = self._point_from_region(region)
-			r = self.view.rowcol(point)[0]
+		points = [self._point_from_region(region) for region in lines]
+		for region, point, r in zip(lines, points, self._table.rows_at_points(points)):
 			row = self._table[r]
-			line_cells = list(cell for cell in row if cell.intersects(region, full_extent=True))
+			line_cells = row.intersecting_cells(region.begin(), region.end(), full_extent=True)
 			if len(line_cells) == 0:
 				if len(row) > 0:
 					# This happens if the cursor is immediately after the final pipe in a Markdown table and there are no further characters, for example
@@ -153,7 +166,7 @@ class TableNavigator:
 				cursors.append(region)
 				cursors_by_level[level] = cursors
 			else:
-				for cursor, level in ((sublime.Region(cell.b, cell.b), cell.capture_level) for cell in line_cells):
+				for cursor, level in ((Region(cell.b, cell.b), cell.capture_level) for cell in line_cells):
 					cursors = cursors_by_level.get(level, [])
 					cursors.append(cursor)
 					cursors_by_level[level] = cursors
@@ -169,22 +182,22 @@ class TableNavigator:
 		self.view.sel().add_all(cursors)
 		return selection_changed		
 
-	def get_next_cells(self, direction, offset=None, return_current=True):
+	@timed('get_next_cells')
+	def get_next_cells(self, direction, offset=None, return_current=True, count=1):
 		'''Gets the set of cells that would relative to the currently selected cells
-		in the given direction.
+		in the given direction, moving by count cells.
 		The new TableCells contain cursor offsets matching the initial selections,
 		unless a specific cursor offset is provided.'''
 		new_cells = []
 		dr, dc = direction
-		selections = list(self.view.sel())
+		points = [self._point_from_region(region) for region in self.view.sel()]
+		selections = list(zip(points, self._table.cells_at_points(points)))
 		if direction in ["right", "down"]:
 			# If multiple regions are selected, avoid clobbering one-another
 			selections = reversed(selections)
-		for region in selections:
-			point = self._point_from_region(region)
-			current_cell = self._table.cell_at_point(point)
+		for point, current_cell in selections:
 			try:
-				next_cell = self.get_next_cell(current_cell, dr, dc, return_current)
+				next_cell = self.get_next_cell(current_cell, dr, dc, return_current, count)
 			except (RowNotInTableError, RowOutOfFileBounds) as e:
 				log.debug(e.err)
 				# Stop at the last cell in the direction of movement
@@ -201,58 +214,73 @@ class TableNavigator:
 				new_cells.append(next_cell)
 		return new_cells
 
-	def get_next_cell(self, current_cell, dr, dc, return_current=True):
-		'''Gets a table cell relative to the given cell.'''
+	def get_next_cell(self, current_cell, dr, dc, return_current=True, count=1):
+		'''Gets a table cell relative to the given cell.
+
+		With a count greater than one, gets the cell that many cells away, or the last cell
+		before the end of the row or table if there are fewer cells in that direction.'''
 		# Use current cell's capture level if it is higher than the configured capture level
 		# to allow movement within a higher capture level, if all current selections are 
 		# already at that capture level.
 		capture_level = max(self.capture_level, current_cell.capture_level)
-		target_row = current_cell.row
+		if dc == 0:
+			# Skip past any rows that don't have enough cells to find the one we're looking for.
+			# In some contexts this is normal; in others, it is a malformed table
+			target_row = self._table.next_row_with_column(current_cell.row, current_cell.col, dr, capture_level, count)
+			return self._table[(target_row, current_cell.col)]
 		target_col = current_cell.col
-		while True:
-			target_row = target_row + dr
+		next_cell = None
+		while count > 0:
 			target_col = target_col + dc
 			if target_col < 0: # direction == LEFT
-				if return_current:
-					return current_cell
-				else:
-					return None
-			try:
-				cell = self._table[(target_row, target_col)]
-				if cell.capture_level <= capture_level: 
-					return cell
-			except ColumnIndexError as e:
-				if dc != 0:
-					if return_current:
-						return current_cell
-					else:
-						return None
-				# This row doesn't have enough cells to find the one we're looking for.
-				# In some contexts this is normal; in others, it is a malformed table
-				log.debug(e.err)
+				break
+			cell = self._table.try_cell(current_cell.row, target_col)
+			if cell is None:
+				break
+			if cell.capture_level <= capture_level: 
+				next_cell = cell
+				count = count - 1
+		if next_cell is None and return_current:
+			return current_cell
+		return next_cell
+
+	@timed('get_named_column_cells')
+	def get_named_column_cells(self, name):
+		'''Gets the cell of the named column on the row of each selected cell.
+
+		If a selected cell's row doesn't have the column, the cell from the table's header row is used instead.
+		Raises ColumnNameNotFoundError if the table of any selected cell doesn't have a column with the given name.'''
+		cells = []
+		for cell in self._selected_cells():
+			ic = self._table.column_index(cell.row, name)
+			target_cell = self._table.try_cell(cell.row, ic)
+			if target_cell is None:
+				target_cell = self._table.cell(self._table.header_row(cell.row), ic)
+			cells.append(target_cell)
+		return cells
 
+	@timed('get_row_end_cells')
 	def get_row_end_cells(self, dc):
 		'''Gets the cell at the far left/right end of each selected table row.'''
 		# Assumption: All cells in a single row have the same capture level.
-		distinct_rows = set(self.view.rowcol(self._point_from_region(region))[0] for region in self.view.sel())
+		distinct_rows = set(self._table.rows_at_points([self._point_from_region(region) for region in self.view.sel()]))
 		if dc < 0:
 			target_col = 0
 		else:
 			target_col = -1
 		return [self._table[(row, target_col)] for row in distinct_rows]
 
+	@timed('get_column_end_cells')
 	def get_column_end_cells(self, dr):
 		'''Gets the cell at the top/bottom of each selected table column.'''
 		# Can't get distinct columns like we do with rows, in case of selections across multiple tables.
-		columns = []
+		columns = TableColumnIndex()
 		column_ends = []
-		for region in self.view.sel():
-			cell = self._table.cell_at_point(self._point_from_region(region))
-			containing_columns = [col for col in columns if col.contains(cell)]
-			if len(containing_columns) > 0:
+		for cell in self._selected_cells():
+			if columns.contains(cell):
 				continue # This cell is already contained in a previously captured column
 			column = self.get_table_column(cell, dr=dr)
-			columns.append(column)
+			columns.add(column)
 			# Get the top/bottom cell of the target capture level, if one exists
 			if dr > 0:
 				column_cells = list(reversed(column))
@@ -267,6 +295,7 @@ class TableNavigator:
 			column_ends.append(target_cell)
 		return column_ends
 
+	@timed('get_row_cells')
 	def get_row_cells(self, dc):
 		key = lambda cell: cell.col
 		if dc > 0:
@@ -275,7 +304,7 @@ class TableNavigator:
 		else:
 			extremum = lambda cells: max(cells, key=key)
 			step = -1
-		selected_cells = [self._table.cell_at_point(self._point_from_region(r)) for r in self.view.sel()]
+		selected_cells = self._selected_cells()
 		extended_cells = []
 		for i, g in itertools.groupby(selected_cells, lambda c: c.row):
 			seed_cell = extremum(g)
@@ -283,49 +312,73 @@ class TableNavigator:
 			extended_cells = itertools.chain(extended_cells, full_row[seed_cell.col::step])
 		return list(extended_cells)
 
+	@timed('get_column_cells')
 	def get_column_cells(self, dr):
 		if dr > 0:
-			regions = list(self.view.sel())
+			selected_cells = self._selected_cells()
 		else:
-			regions = reversed(list(self.view.sel()))
+			selected_cells = reversed(self._selected_cells())
 		columns = []
-		for region in regions:
-			cell = self._table.cell_at_point(self._point_from_region(region))
-			containing_columns = [col for col in columns if col.contains(cell)]
-			if len(containing_columns) > 0:
+		column_index = TableColumnIndex()
+		for cell in selected_cells:
+			if column_index.contains(cell):
 				continue # This cell is already contained in a previously captured column
-			columns.append(self.get_table_column(cell, dr))
+			column = self.get_table_column(cell, dr, windowed=True)
+			columns.append(column)
+			column_index.add(column)
 		return [cell for col in columns for cell in col]
 
-	def get_table_column(self, seed_cell, dr=None):
+	def _selected_cells(self):
+		'''Gets the cell at each of the current selections.'''
+		return self._table.cells_at_points([self._point_from_region(region) for region in self.view.sel()])
+
+	@timed('get_table_column')
+	def get_table_column(self, seed_cell, dr=None, windowed=False):
 		'''Gets all TableCell found in the table column above and below the given seed_cell.
 
 		Gaps in the table where a row is a table row but has insufficient columns are 
 		"jumped", but gaps between multiple tables (i.e. rows containing no table columns)
 		are not.
 
-		To only get cells in one direction from the seed cell, provide dr = +1 (down) or -1 (up).'''
+		To only get cells in one direction from the seed cell, provide dr = +1 (down) or -1 (up).
+		If windowed is True and the view is a large file, only the cells within the window of rows
+		around the seed cell are found, by reading the rows one block at a time up to the edges of
+		the table or the window. Otherwise, the bounds of the whole table are found first.'''
+		window_first, window_last = self._table.row_window(seed_cell.row) if windowed else (None, None)
+		if window_first is None:
+			first_row, last_row = self._table.table_bounds(seed_cell.row)
+			if dr is not None:
+				first_row, last_row = (seed_cell.row, last_row) if dr > 0 else (first_row, seed_cell.row)
+			cells = (self._table.try_cell(row.row, seed_cell.col) for row in self._table.table_rows(first_row, last_row))
+			return TableColumn(cell for cell in cells if cell is not None)
 		cells = [seed_cell]
+		first_row, last_row = self._table.table_row_bounds(seed_cell.row)
+		first_row = window_first if first_row is None else max(first_row, window_first)
+		last_row = window_last if last_row is None else min(last_row, window_last)
 		if dr is None or dr < 0:
 			# Get all cells above current row:
-			for r in range(seed_cell.row-1, -1, -1):
+			r = seed_cell.row - 1
+			while r >= first_row:
+				self._table.load_rows_from(r, -1, first_row)
 				try:
-					cells.append(self._table[(r, seed_cell.col)])
-				except ColumnIndexError as e:
-					log.info(e.err)
-					# jump past this cell and keep going
+					cell = self._table.try_cell(r, seed_cell.col)
 				except RowNotInTableError:
 					break # at the start of the table
+				if cell is not None:
+					cells.append(cell)
+				# otherwise jump past this row and keep going
+				r = self._table.row(r).row - 1 # the line before the row, which can be a multi-line CSV record
 		if dr is None or dr > 0:
 			# Get all cells below current row:
 			r = seed_cell.row
-			while(True):
-				r = r + 1
+			while self._table.row(r).last_row < last_row:
+				r = self._table.row(r).last_row + 1
+				self._table.load_rows_from(r, 1, last_row)
 				try:
-					cells.append(self._table[(r, seed_cell.col)])
-				except ColumnIndexError as e:
-					log.info(e.err)
-					# jump past this cell and keep going
+					cell = self._table.try_cell(r, seed_cell.col)
 				except (RowNotInTableError, RowOutOfFileBounds):
 					break
+				if cell is not None:
+					cells.append(cell)
+				# otherwise jump past this row and keep going
 		return TableColumn(cells)
\ No newline at end of file
@@ -1,64 +1,244 @@
+from TabNav.src.enum import capture_levels
 from TabNav.src.util import get_logger
-from TabNav.src.table import TableCell, TableRow
+from TabNav.src.stats import timed
+from TabNav.src.table import TableRow
+from array import array
 import re
 
 log = get_logger(__package__, __name__)
 
+_word_char = re.compile(r'\w')
+_named_group = re.compile(r'(?<!\\)\(\?P(<|=)(\w+)')
+_numbered_backreference = re.compile(r'\\[1-9]')
+_markup_level = capture_levels['markup'][0]
+
+
+def _scan_pattern_source(source):
+	'''Checks a regular expression's source for constructs that depend on the content preceding the match.
+
+	Returns a tuple of (strippable, context_sensitive). The pattern is strippable if its only such construct
+	is a single leading '^' anchor which can be removed, and the pattern then matched from the search position.
+	Otherwise, the pattern is context sensitive if it contains any '^' or '\\A' anchor, or any lookbehind.'''
+	anchors = []
+	sensitive = False
+	top_level_alternation = False
+	depth = 0
+	i = 0
+	n = len(source)
+	while i < n:
+		c = source[i]
+		if c == '\\':
+			if source[i+1:i+2] == 'A':
+				sensitive = True
+			i = i + 2
+			continue
+		if c == '[':
+			# Skip over the character class, where '^' is not an anchor
+			i = i + 1
+			if source[i:i+1] == '^':
+				i = i + 1
+			if source[i:i+1] == ']':
+				i = i + 1
+			while i < n and source[i] != ']':
+				if source[i] == '\\':
+					i = i + 1
+				i = i + 1
+		elif c == '^':
+			anchors.append(i)
+		elif c == '(':
+			if source.startswith('(?<=', i) or source.startswith('(?<!', i):
+				sensitive = True
+			depth = depth + 1
+		elif c == ')':
+			depth = depth - 1
+		elif c == '|' and depth == 0:
+			top_level_alternation = True
+		i = i + 1
+	strippable = not sensitive and not top_level_alternation and anchors == [0]
+	return strippable, sensitive or len(anchors) > 0
+
+
+class CellPattern:
+	'''A compiled cell pattern, which scans the cells of a line without copying any of its content.'''
+	def __init__(self, pattern, ordered_capture_levels):
+		self.regex = re.compile(pattern)
+		strippable, self.context_sensitive = _scan_pattern_source(self.regex.pattern)
+		if strippable:
+			# Matching the remainder of the pattern at the search position is equivalent to matching
+			# the whole pattern against a copy of the content starting at that position.
+			self.anchored = re.compile(self.regex.pattern[1:], self.regex.flags)
+			self.context_sensitive = False
+		else:
+			self.anchored = None
+		self.capture_level = None
+		self.capture_group = None
+		groups = self.regex.groupindex
+		# Cells of patterns that can't capture anything finer than markup, such as Markdown's separator row
+		self.markup_only = all(level >= _markup_level for name, level in ordered_capture_levels if name in groups)
+		for name, level in ordered_capture_levels:
+			if name in groups:
+				self.capture_level = level
+				self.capture_group = groups[name]
+				break
+		self.markup_group = groups.get('markup', self.capture_group)
+
+	def _matches(self, content, pos, endpos):
+		if self.anchored is not None:
+			cell_match = self.anchored.match(content, pos, endpos)
+			return () if cell_match is None else (cell_match,)
+		return self.regex.finditer(content, pos, endpos)
+
+	def scan(self, content, pos, endpos):
+		'''Yields a tuple of (match_end, capture_start, capture_end, markup_start, markup_end) for each match of
+		the pattern in the given content, between pos and endpos.
+
+		If the pattern's match could depend on the content preceding pos, the remaining content is copied
+		so that the pattern is matched as though that content were the entire line.'''
+		offset = 0
+		if pos > 0 and (self.context_sensitive or _word_char.match(content, pos - 1) is not None):
+			offset = pos
+			content = content[pos:endpos]
+			pos = 0
+			endpos = len(content)
+		capture_group = self.capture_group
+		markup_group = self.markup_group
+		for cell_match in self._matches(content, pos, endpos):
+			if capture_group is None:
+				yield (offset + cell_match.end(), None, None, None, None)
+				continue
+			capture_start, capture_end = cell_match.span(capture_group)
+			markup_start, markup_end = cell_match.span(markup_group)
+			yield (offset + cell_match.end(), offset + capture_start, offset + capture_end, offset + markup_start, offset + markup_end)
+
+
 class RowParser:
-	def __init__(self, cell_patterns, line_pattern, ordered_capture_levels):
+	def __init__(self, cell_patterns, line_pattern, ordered_capture_levels, max_cells=None):
 		self.capture_levels = ordered_capture_levels
+		self.max_cells = max_cells
 		if cell_patterns is None:
-			self.cell_patterns = []
+			cell_patterns = []
 		elif isinstance(cell_patterns, str):
-			self.cell_patterns = [re.compile(cell_patterns)]
-		else:
-			self.cell_patterns = [re.compile(p) for p in cell_patterns]
+			cell_patterns = [cell_patterns]
+		self.cell_patterns = [CellPattern(p, ordered_capture_levels) for p in cell_patterns]
 		if line_pattern is not None:
 			self.line_pattern = re.compile(line_pattern)
 		else:
 			self.line_pattern = None
 
-	def parse_row(self, line_content, row, line_start_point, cell_direction=1):
-		if self.line_pattern is not None:
+	@timed('RowParser.parse_row')
+	def parse_row(self, line_content, row, line_start_point, cell_direction=1, table_span=None):
+		'''Parses the cells of the given line, returning None if the line isn't matched by this parser,
+		or if it has more than max_cells cells.
+
+		If the line pattern has already been matched against the line, the span of its 'table' group
+		can be given as table_span to avoid searching the line again.'''
+		table_start = 0
+		table_end = len(line_content)
+		if table_span is not None:
+			table_start, table_end = table_span
+		elif self.line_pattern is not None:
 			line_match = self.line_pattern.search(line_content)
 			if line_match is None:
 				return None
 			try:
-				line_start_point = line_start_point + line_match.start('table')
-				line_content = line_match.group('table')
+				table_start, table_end = line_match.span('table')
 			except IndexError:
 				log.debug("Line pattern '%s' does not contain a named capture group '<table>'. The line will be captured but ignored.", self.line_pattern.pattern)
-				return TableRow(row, [])
-		cells = []
-		cell_end = -1
+				return TableRow(row)
+		cell_data = array('l')
 		col_index = -1
-		cell_offset = 0
-		search_content = line_content
+		cell_offset = table_start
+		markup_only = True
 		for pattern in self.cell_patterns:
-			if cell_end > 0:
-				cell_offset = cell_offset + cell_end
-			if cell_offset > 0:
-				search_content = line_content[cell_offset:]
 			cell_end = -1
-			for cell_match in pattern.finditer(search_content):
-				if cell_end == cell_match.end():
-					# cell_match is on the final, zero-width match before the final delimiter. This is not a table cell.
+			for match_end, capture_start, capture_end, markup_start, markup_end in pattern.scan(line_content, cell_offset, table_end):
+				if cell_end == match_end:
+					# The match is the final, zero-width match before the final delimiter. This is not a table cell.
 					break
-				cell_end = cell_match.end()
+				cell_end = match_end
 				col_index = col_index + 1
-				for name, level in self.capture_levels:
-					try:
-						capture_start = line_start_point + cell_offset + cell_match.start(name)
-						capture_end = line_start_point + cell_offset + cell_match.end(name)
-					except IndexError:
-						# The cell pattern doesn't include the level as a capture group
-						continue
-					else:
-						markup_start = line_start_point + cell_offset + cell_match.start('markup')
-						markup_end = line_start_point + cell_offset + cell_match.end('markup')
-						cell = TableCell(row, col_index, capture_start, capture_end, markup_start, markup_end, level, cell_direction)
-						cells.append(cell)
-						break
-		if len(cells) == 0:
+				if self.max_cells is not None and col_index >= self.max_cells:
+					log.debug("Line %d has more than %d cells, and is not parsed.", row+1, self.max_cells)
+					return None
+				if capture_start is None:
+					# The cell pattern doesn't include any of the capture levels as a capture group
+					continue
+				cell_data.extend((capture_start, capture_end, markup_start, markup_end, col_index, pattern.capture_level))
+				markup_only = markup_only and pattern.markup_only
+			if cell_end >= 0:
+				cell_offset = cell_end
+		if len(cell_data) == 0:
 			return None
-		return TableRow(row, cells)
+		return TableRow(row, line_start_point, cell_data, cell_direction, markup_only)
+
+
+class LineClassifier:
+	'''Matches a line against the line patterns of several RowParsers in a single regex pass.
+
+	Each line pattern is wrapped in a lookahead, with its named groups renamed to be unique, and the
+	lookaheads combined in one alternation. The first alternative to match identifies the same parser
+	as searching each line pattern in turn would have.'''
+	def __init__(self, parsers):
+		self._parsers = parsers
+		alternatives = []
+		line_groups = []
+		for index, parser in enumerate(parsers):
+			if parser.line_pattern is None:
+				continue
+			prefix = '_{0}_'.format(index)
+			source = _named_group.sub(lambda m: '(?P{0}{1}{2}'.format(m.group(1), prefix, m.group(2)), parser.line_pattern.pattern)
+			if _scan_pattern_source(source)[0]:
+				# Anchored patterns can only match at the start of the line
+				alternatives.append('(?=(?P<_{0}>{1}))'.format(index, source))
+			else:
+				alternatives.append('(?=[\\s\\S]*?(?P<_{0}>{1}))'.format(index, source))
+			line_groups.append((index, '_{0}'.format(index), prefix + 'table' if 'table' in parser.line_pattern.groupindex else None))
+		self._regex = re.compile('|'.join(alternatives))
+		# The group wrapping each line pattern is the last group closed when its alternative matches
+		groups = self._regex.groupindex
+		self._line_groups = dict((groups[line_group], (index, groups[table_group] if table_group is not None else None))
+			for index, line_group, table_group in line_groups)
+
+	def classify(self, line_content):
+		'''Gets a tuple of the index of the first parser whose line pattern matches the line, and the span of
+		its 'table' group, or None if the parser has no 'table' group.
+
+		If none of the line patterns match, the index is the number of parsers.'''
+		line_match = self._regex.match(line_content)
+		if line_match is None:
+			return len(self._parsers), None
+		index, table_group = self._line_groups[line_match.lastindex]
+		return index, (line_match.span(table_group) if table_group is not None else None)
+
+	def parse_row(self, line_content, row, line_start_point, cell_direction=1):
+		'''Parses the line with the first of the parsers that matches it, or returns None if none do.'''
+		first_index, table_span = self.classify(line_content)
+		for index, parser in enumerate(self._parsers):
+			if index < first_index:
+				if parser.line_pattern is not None:
+					# The classifier has already determined that the line pattern doesn't match
+					continue
+				table_row = parser.parse_row(line_content, row, line_start_point, cell_direction)
+			elif index == first_index:
+				table_row = parser.parse_row(line_content, row, line_start_point, cell_direction, table_span)
+			else:
+				table_row = parser.parse_row(line_content, row, line_start_point, cell_direction)
+			if table_row is not None:
+				return table_row
+		return None
+
+
+def compile_line_classifier(parsers):
+	'''Creates a LineClassifier for the given parsers, or returns None if it wouldn't save any regex searches,
+	or if the line patterns can't be safely combined.'''
+	line_patterns = [p.line_pattern.pattern for p in parsers if p.line_pattern is not None]
+	if len(line_patterns) < 2:
+		return None
+	if any(_numbered_backreference.search(p) for p in line_patterns):
+		# Group numbers change when the patterns are combined
+		return None
+	try:
+		return LineClassifier(parsers)
+	except re.error as e:
+		log.debug("Unable to combine the line patterns into a single classifier: %s", e)
+		return None
@@ -0,0 +1,109 @@
+from TabNav.src.context import get_current_context
+from TabNav.src.exceptions import *
+from TabNav.src.stats import timed
+from TabNav.src.table import TableView
+from TabNav.src.util import get_logger
+
+log = get_logger(__package__, __name__)
+
+_memos = {} # The most recent QueryMemo of each view, keyed by view ID
+
+
+class QueryMemo:
+	'''Stores the context resolved for a view, and the results of checking the is_tabnav_context key binding
+	context against it, for as long as the view's text, selections and TabNav settings don't change.
+
+	The TableView built to check the key binding context is kept, so that the command triggered by the
+	same key press can use it rather than parsing the selected rows again.'''
+	def __init__(self, signature, context):
+		self.signature = signature
+		self.context = context
+		self.results = {} # keyed by match_all
+		self.table = None
+		self.table_has_selections = False # True if all of the selected rows were parsed into the table
+
+
+def _signature(view, context_key, capture_level):
+	'''Gets a value that changes whenever the context resolved for the view, or the rows of its selections, could change.'''
+	settings = view.settings()
+	return (view.change_count(), tuple((region.a, region.b) for region in view.sel()), context_key, capture_level,
+		settings.get('syntax'), settings.get('tabnav.enabled'), settings.get('tabnav.capture_level'), settings.get('tabnav.delimiter'),
+		settings.get('delimiter')) # the Advanced CSV delimiter
+
+
+def _get_memo(view, context_key, capture_level):
+	signature = _signature(view, context_key, capture_level)
+	memo = _memos.get(view.id())
+	if memo is None or memo.signature != signature:
+		memo = QueryMemo(signature, get_current_context(view, context_key, capture_level))
+		_memos[view.id()] = memo
+	return memo
+
+
+def get_query_context(view, context_key=None, capture_level=None):
+	'''Gets the current TabnavContext of the view, as get_current_context does, re-using the context resolved
+	by the previous query if nothing it depends on has changed since.'''
+	return _get_memo(view, context_key, capture_level).context
+
+
+@timed('is_tabnav_context')
+def is_tabnav_context(view, context_key=None, match_all=False):
+	'''Checks whether the first selection, or all selections if match_all is True, are within a table
+	of the view's current context.
+
+	The result is memoized until the view's text, selections or TabNav settings change.'''
+	memo = _get_memo(view, context_key, None)
+	is_context = memo.results.get(match_all)
+	if is_context is not None:
+		return is_context
+	if memo.context is None:
+		is_context = False
+	else:
+		table = memo.table
+		if table is None:
+			table = TableView(view, memo.context)
+		try:
+			if match_all:
+				# parse all of the current selections
+				table.parse_selected_rows()
+				memo.table_has_selections = True
+			else:
+				point = view.sel()[0].begin()
+				r = view.rowcol(point)[0]
+				table[r]
+		except RowNotInTableError as e:
+			log.debug(e.err)
+			is_context = False
+		else:
+			is_context = True
+		memo.table = table
+	memo.results[match_all] = is_context
+	return is_context
+
+
+def take_query_table(view, context, cell_direction=1):
+	'''Gets the TableView built by the previous query of the view, if it's still valid for the given context
+	and cell direction, with the rows of all of the selections parsed. Otherwise returns None.
+
+	If the query only checked the first selection, the rest of the selected rows are parsed into the TableView first.
+	The TableView is only given out once, since the command that uses it can add state to its cells.'''
+	memo = _memos.get(view.id())
+	if memo is None or memo.table is None or cell_direction != 1:
+		return None
+	signature = _signature(view, None, None)
+	if memo.context is not context or memo.signature[:2] != signature[:2] or memo.signature[4:] != signature[4:]:
+		return None
+	table = memo.table
+	if not memo.table_has_selections:
+		table.parse_selected_rows()
+	memo.table = None
+	memo.table_has_selections = False
+	return table
+
+
+def clear_query_memos(view_id=None):
+	'''Discards the memoized queries of the given view, or of all views if no view ID is given.'''
+	if view_id is None:
+		_memos.clear()
+	else:
+		_memos.pop(view_id, None)
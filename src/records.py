@@ -0,0 +1,127 @@
+from TabNav.src.buffer import Region
+from TabNav.src.util import get_logger
+import re
+
+log = get_logger(__package__, __name__)
+
+# The number of lines read from the view at once while scanning for record boundaries
+_scan_block_lines = 1024
+
+
+class RecordIndex:
+	'''Finds the lines of a CSV file on which each record starts, where quoted fields can contain newlines.
+
+	A line continues the previous record if the previous line ended within a quoted field. A field is only
+	quoted if it starts with a quote, after the delimiter and any spaces, and it ends at the next quote that
+	isn't doubled, so quotes within unquoted fields, such as 5'11", don't affect the records.
+
+	Whether each line ends within a quoted field depends on all of the lines before it, so lines are scanned
+	from the top of the file, but only as far as they're needed, and after an edit, scanning resumes from
+	the first modified line.
+
+	A record is never more than max_lines lines long, so that a stray quote can't join the rest of the
+	file into a single record.
+
+	Lines are also scanned by the background warm-up, so the given lock is held while the index is read
+	or updated.'''
+	def __init__(self, max_lines, delimiter, lock):
+		self._max_lines = max_lines
+		self._delimiter = re.compile(delimiter)
+		self._lock = lock
+		# For each scanned line, and the next line to be scanned, whether it continues the previous record
+		self._continues = bytearray(1)
+		self._complete = False # True once the last line of the file has been scanned
+
+	def record_bounds(self, view, r):
+		'''Gets the first and last lines of the record that includes line r.'''
+		with self._lock:
+			self._scan(view, r + 1)
+			continues = self._continues
+			if r < 0 or r >= len(continues):
+				return (r, r) # beyond the end of the file
+			first = self.record_start(r)
+			last = r
+			while True:
+				self._scan(view, last + 1)
+				if last + 1 >= len(continues) or not continues[last + 1]:
+					return (first, last)
+				last = last + 1
+
+	def record_start(self, r):
+		'''Gets the first line of the record that includes line r, from the lines scanned so far.'''
+		with self._lock:
+			continues = self._continues
+			if r >= len(continues):
+				return r
+			while r > 0 and continues[r]:
+				r = r - 1
+			return r
+
+	def truncate(self, r):
+		'''Discards the scan results from line r onward, which have been modified.
+
+		Whether line r continues the previous record only depends on the lines before it, so is kept.'''
+		with self._lock:
+			del self._continues[r + 1:]
+			self._complete = False
+
+	def _scan(self, view, r):
+		'''Scans blocks of lines until it's known whether line r continues the previous record,
+		or until the end of the file.'''
+		continues = self._continues
+		while len(continues) <= r and not self._complete:
+			first = len(continues) - 1
+			start = view.text_point(first, 0)
+			if view.rowcol(start)[0] != first:
+				# The file is shorter than when the lines were last scanned
+				del continues[first:]
+				self._complete = True
+				return
+			end = view.text_point(first + _scan_block_lines, 0)
+			lines = view.substr(Region(start, end)).split('\n')
+			if view.rowcol(end)[0] == first + _scan_block_lines:
+				lines.pop() # the empty start of the line after the block
+			else:
+				self._complete = True
+			quoted = continues[-1]
+			record_lines = first - self.record_start(first) + 1
+			for i, line in enumerate(lines):
+				if '"' in line:
+					quoted = self._ends_quoted(line, quoted)
+				if quoted and record_lines >= self._max_lines:
+					log.debug("Ending the record at line %d, which has reached %d lines.", first + i + 1, self._max_lines)
+					quoted = False
+				continues.append(quoted)
+				record_lines = record_lines + 1 if quoted else 1
+			if self._complete:
+				continues.pop() # there's no line after the last one
+
+	def _ends_quoted(self, line, quoted):
+		'''Checks whether the line ends within a quoted field, given whether it starts within one.'''
+		n = len(line)
+		p = 0
+		while True:
+			if quoted:
+				# Find the closing quote, skipping escaped (doubled) quotes
+				while True:
+					j = line.find('"', p)
+					if j < 0:
+						return True
+					if j + 1 < n and line[j + 1] == '"':
+						p = j + 2
+					else:
+						p = j + 1
+						quoted = False
+						break
+			else:
+				s = p
+				while s < n and line[s] == ' ':
+					s = s + 1
+				if s < n and line[s] == '"':
+					p = s + 1
+					quoted = True
+					continue
+			delimiter = self._delimiter.search(line, p)
+			if delimiter is None:
+				return False
+			p = delimiter.end()
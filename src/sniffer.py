@@ -0,0 +1,55 @@
+from TabNav.src.util import get_logger
+from collections import Counter
+import re
+
+log = get_logger(__package__, __name__)
+
+# A double-quoted CSV field, in which double-quotes are escaped by doubling them
+_quoted_field = r' *"(?:""|[^"])*"(?= *(?:{0}|$))'
+
+
+class _DelimiterCounter:
+	'''Counts the fields of a line split by a delimiter, ignoring delimiters within quoted fields.'''
+	def __init__(self, delimiter):
+		self._first_quoted = re.compile('^' + _quoted_field.format(delimiter))
+		# Each match is a delimiter, along with the quoted field that follows it, if any
+		self._delimiter = re.compile('(?:{0})(?:{1})?'.format(delimiter, _quoted_field.format(delimiter)))
+
+	def fields(self, line):
+		first = self._first_quoted.match(line)
+		pos = 0 if first is None else first.end()
+		return sum(1 for d in self._delimiter.finditer(line, pos)) + 1
+
+
+def _score(counts):
+	'''Scores the field counts of a candidate delimiter by the fraction of lines that have the most common number of fields.
+
+	Returns a tuple of the score and the most common number of fields.'''
+	fields, lines = Counter(counts).most_common(1)[0]
+	return (lines / len(counts), fields)
+
+
+def sniff_delimiter(lines, candidates):
+	'''Infers which of the candidate delimiter patterns separates the fields of the given lines.
+
+	Each candidate is scored by how consistently it splits the lines into the same number of fields,
+	with delimiters within quoted fields ignored. The most consistent candidate is chosen, then the one
+	that splits the lines into the most fields, then the first in the list of candidates.
+	Returns None if no candidate splits the lines into more than one field.'''
+	lines = [line for line in lines if line.strip() != '']
+	if len(lines) == 0:
+		return None
+	best = None
+	best_score = None
+	for candidate in candidates:
+		try:
+			counter = _DelimiterCounter(candidate)
+		except re.error as e:
+			log.warning("Invalid auto delimiter '%s': %s", candidate, e)
+			continue
+		score = _score([counter.fields(line) for line in lines])
+		log.debug("Delimiter '%s' scored %s", candidate, score)
+		if score[1] > 1 and (best_score is None or score > best_score):
+			best = candidate
+			best_score = score
+	return best
@@ -0,0 +1,192 @@
+from TabNav.src.util import get_logger
+from contextlib import contextmanager
+import bisect
+import functools
+import threading
+import time
+
+log = get_logger(__package__, __name__)
+
+# The upper bounds, in milliseconds, of the latency histograms' buckets. The last bucket has no upper bound.
+_bucket_bounds = [0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000, 3000]
+# The name that stats recorded outside of any command are attributed to
+_no_command = '(no command)'
+
+enabled = False # Whether stats are being recorded, from the "performance_stats" package setting
+_stats = {} # CommandStats, keyed by command name
+_lock = threading.Lock() # Held while stats are recorded, since rows are also parsed in the background
+_local = threading.local() # The name of the command running on each thread
+
+
+class Histogram:
+	'''Counts the latencies recorded for an operation, in buckets that grow roughly threefold.'''
+	def __init__(self):
+		self.buckets = [0] * (len(_bucket_bounds) + 1)
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def add(self, ms):
+		self.buckets[bisect.bisect_left(_bucket_bounds, ms)] += 1
+		self.count = self.count + 1
+		self.total = self.total + ms
+		self.max = max(self.max, ms)
+
+	def percentile(self, p):
+		'''Gets the upper bound of the bucket that contains the given percentile, or the maximum if that's lower.'''
+		target = self.count * p / 100
+		seen = 0
+		for i, n in enumerate(self.buckets):
+			seen = seen + n
+			if seen >= target and n > 0:
+				return min(_bucket_bounds[i], self.max) if i < len(_bucket_bounds) else self.max
+		return self.max
+
+
+class CommandStats:
+	'''The latencies of the operations, and the counts of events such as rows parsed and view API calls,
+	recorded while a single command ran.'''
+	def __init__(self):
+		self.timings = {} # Histograms, keyed by operation name
+		self.counters = {} # keyed by event name
+
+
+def set_stats_enabled(value):
+	'''Starts or stops recording stats. Stats that have already been recorded are kept.'''
+	global enabled
+	enabled = bool(value)
+	log.info("Performance stats %s", "enabled" if enabled else "disabled")
+
+
+def clear_stats():
+	'''Discards all of the recorded stats.'''
+	with _lock:
+		_stats.clear()
+
+
+def _current_stats():
+	name = getattr(_local, 'command', None) or _no_command
+	stats = _stats.get(name)
+	if stats is None:
+		stats = CommandStats()
+		_stats[name] = stats
+	return stats
+
+
+@contextmanager
+def command_stats(name):
+	'''Attributes the stats recorded on this thread to the named command, until the context exits.'''
+	previous = getattr(_local, 'command', None)
+	_local.command = name
+	try:
+		yield
+	finally:
+		_local.command = previous
+
+
+def add_time(operation, seconds):
+	'''Records the latency of a single run of an operation, if stats are enabled.'''
+	if not enabled:
+		return
+	with _lock:
+		timings = _current_stats().timings
+		histogram = timings.get(operation)
+		if histogram is None:
+			histogram = Histogram()
+			timings[operation] = histogram
+		histogram.add(seconds * 1000)
+
+
+def add_count(event, n=1):
+	'''Adds to the count of an event, if stats are enabled.'''
+	if not enabled or n == 0:
+		return
+	with _lock:
+		counters = _current_stats().counters
+		counters[event] = counters.get(event, 0) + n
+
+
+def timed(operation):
+	'''Decorates a function to record its latency as the given operation, if stats are enabled.'''
+	def decorator(func):
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if not enabled:
+				return func(*args, **kwargs)
+			start = time.perf_counter()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				add_time(operation, time.perf_counter() - start)
+		return wrapper
+	return decorator
+
+
+def timed_command(operation):
+	'''Decorates a method of a command to record its latency as the given operation, and to attribute
+	all of the stats recorded while it runs to the command.'''
+	def decorator(func):
+		@functools.wraps(func)
+		def wrapper(self, *args, **kwargs):
+			if not enabled:
+				return func(self, *args, **kwargs)
+			with command_stats(self.name()):
+				start = time.perf_counter()
+				try:
+					return func(self, *args, **kwargs)
+				finally:
+					add_time(operation, time.perf_counter() - start)
+		return wrapper
+	return decorator
+
+
+def instrument_view(view):
+	'''Gets a wrapper of the view that counts the calls made to its API, if stats are enabled.
+	Otherwise, the view itself is returned.'''
+	if not enabled or isinstance(view, _CountingView):
+		return view
+	return _CountingView(view)
+
+
+class _CountingView:
+	'''Passes all attribute access through to a view, counting each call of one of its methods.'''
+	def __init__(self, view):
+		self._view = view
+
+	def __getattr__(self, name):
+		attr = getattr(self._view, name)
+		if not callable(attr):
+			return attr
+		event = 'view.' + name
+		def call(*args, **kwargs):
+			add_count(event)
+			return attr(*args, **kwargs)
+		return call
+
+
+def format_stats():
+	'''Formats the recorded stats as a plain text report, with a section for each command.'''
+	with _lock:
+		names = sorted(_stats)
+		if len(names) == 0:
+			if not enabled:
+				return "No stats have been recorded. Set \"performance_stats\" to true in the TabNav settings to record them.\n"
+			return "No stats have been recorded yet.\n"
+		lines = []
+		header = '  {0:<28} {1:>8} {2:>10} {3:>9} {4:>9} {5:>9} {6:>9}'.format('operation', 'count', 'total ms', 'mean ms', 'p50 ms', 'p95 ms', 'max ms')
+		for name in names:
+			stats = _stats[name]
+			lines.append(name)
+			lines.append(header)
+			for operation in sorted(stats.timings):
+				h = stats.timings[operation]
+				lines.append('  {0:<28} {1:>8d} {2:>10.1f} {3:>9.2f} {4:>9.2f} {5:>9.2f} {6:>9.2f}'.format(
+					operation, h.count, h.total, h.total / h.count, h.percentile(50), h.percentile(95), h.max))
+			for event in sorted(stats.counters):
+				lines.append('  {0:<28} {1:>8d}'.format(event, stats.counters[event]))
+			lines.append('')
+		lines.append('Latency buckets (ms): ' + ', '.join(str(b) for b in _bucket_bounds) + ', more')
+		for name in names:
+			for operation, h in sorted(_stats[name].timings.items()):
+				lines.append('  {0} / {1}: {2}'.format(name, operation, ' '.join(str(n) for n in h.buckets)))
+		return '\n'.join(lines) + '\n'
@@ -1,12 +1,31 @@
+from TabNav.src.buffer import Region
+from TabNav.src.cache import get_record_index, get_row_cache, get_skip_indexes, get_table_extents, row_cache_lock
+from TabNav.src.extents import OUTSIDE, INSIDE
 from TabNav.src.exceptions import *
+from TabNav.src.stats import add_count, instrument_view, timed
 from TabNav.src.util import get_logger, score_tabnav_selectors
-import sublime
+from array import array
+import bisect
 import itertools
+import threading
 
 log = get_logger(__package__, __name__)
 
-class TableCell(sublime.Region):
-	'''Extends the base sublime.Region class with logic specific to TabNav's cells.'''
+_initial_block_size = 16
+_max_block_size = 1024
+
+# Points further apart than this have their rows looked up separately, rather than reading the text between them
+_max_point_gap = 1 << 16
+# The largest amount of text read at once to count the rows between points
+_max_read_size = 1 << 22
+
+# The number of values stored per cell in a TableRow's cell data
+CELL_FIELDS = 6
+
+class TableCell(Region):
+	'''Extends the base Region class with logic specific to TabNav's cells.'''
+	__slots__ = ('_full_begin', '_full_end', '_cell_begin', '_cell_end', '_row', '_col', '_capture_level', '_direction', '_cursor_offsets', '_initial_regions')
+
 	def __init__(self, rownum, col_index, capture_start, capture_end, cell_start, cell_end, capture_level, direction=1):
 		'''Creates a new TableCell with the following properties:
 
@@ -23,18 +42,22 @@ class TableCell(sublime.Region):
 			super().__init__(capture_start, capture_end)
 		else:
 			super().__init__(capture_end, capture_start)
-		self._full_extent = (min(cell_start, capture_start), max(cell_end, capture_end))
+		self._full_begin = min(cell_start, capture_start)
+		self._full_end = max(cell_end, capture_end)
 		if col_index == 0:
 			# Always use the full extent of the cell for the first column to the row
-			self._cell_extent = self._full_extent
+			self._cell_begin = self._full_begin
+			self._cell_end = self._full_end
 		else:
-			self._cell_extent = (cell_start, cell_end)
-		self._cursor_offsets = set()
+			self._cell_begin = cell_start
+			self._cell_end = cell_end
 		self._row = rownum
 		self._col = col_index
 		self._capture_level = capture_level
 		self._direction = direction
-		self._initial_regions = []
+		# Most cells never get cursors or initial regions, so these are only allocated when needed
+		self._cursor_offsets = None
+		self._initial_regions = None
 
 	def intersects(self, region, full_extent=True):
 		'''Overrides the default `Region.intersects` method.
@@ -47,9 +70,9 @@ class TableCell(sublime.Region):
 		returns false in this scenario.
 		'''
 		if full_extent:
-			c = self._full_extent
+			c = (self._full_begin, self._full_end)
 		else:
-			c = self._cell_extent
+			c = (self._cell_begin, self._cell_end)
 		r = (region.begin(), region.end())
 		return (r[0] <= c[0] and c[0] <= r[1]) \
 			or (r[0] <= c[1] and c[1] <= r[1]) \
@@ -86,58 +109,192 @@ class TableCell(sublime.Region):
 
 	@property
 	def initial_regions(self):
+		if self._initial_regions is None:
+			return []
 		return self._initial_regions
 
 	def add_cursor_offset(self, offset):
 		'''Adds the given offset as the relative position within the cell
 		as a point at which a cursor should be placed.'''
+		if self._cursor_offsets is None:
+			self._cursor_offsets = set()
 		self._cursor_offsets.add(offset)
 
 	def get_cursors_as_regions(self):
-		'''Gets a list of sublime.Region objects, one for each cursor cursor
+		'''Gets a list of Region objects, one for each cursor cursor
 		that has been added to the cell.'''
 		cursors = []
+		if self._cursor_offsets is None:
+			return cursors
 		for offset in self._cursor_offsets:
 			if offset >= 0:
 				point = min(self.begin() + offset, self.end())
 			else:
 				point = max(self.begin(), self.end() + offset + 1)
-			cursors.append(sublime.Region(point, point))
+			cursors.append(Region(point, point))
 		return cursors
 
 	def add_initial_region(self, region):
+		if self._initial_regions is None:
+			self._initial_regions = []
 		self._initial_regions.append(region)
 
 
 class TableRow:
-	'''Stores the TableCell objects parsed from a single line of text.'''
-	def __init__(self, rownum, cells):
+	'''Stores the cells parsed from a single line of text, or from a CSV record that spans multiple lines.
+
+	The cells' extents are stored in a flat array, as offsets from the start of the line.
+	TableCell objects are only created for the cells that are accessed, and are discarded
+	when the row is reset.'''
+	def __init__(self, rownum, line_start=0, cell_data=None, direction=1, markup=False):
 		'''Creates a new TableRow with the following properties:
 
 		* `rownum`: integer index of the row in the view on which the cell is found
-		* `cells`: a list of TableCells that make up this row
+		* `line_start`: the point in the view at the start of the line
+		* `cell_data`: an array with CELL_FIELDS consecutive values for each cell: the capture start and end,
+		  the cell start and end (all relative to line_start), the column index and the capture level
+		* `direction`: the direction of the row's TableCells
+		* `markup`: True if all of the row's cells contain only markup, such as a separator row
 		'''
 		self._row = rownum
-		self._cells = cells
+		self._last_row = rownum
+		self._line_start = line_start
+		self._data = cell_data if cell_data is not None else array('l')
+		self._direction = direction
+		self._markup = markup
+		self._cells = None
+		self._bounds = {}
 
 	@property
 	def row(self):
 		return self._row	
 
+	@property
+	def last_row(self):
+		'''The index of the last line of the row, which is only after the first for a multi-line CSV record.'''
+		return self._last_row
+
+	@last_row.setter
+	def last_row(self, value):
+		self._last_row = value
+
+	@property
+	def is_markup(self):
+		return self._markup
+
 	def __getitem__(self, key):
-		try:
-			return self._cells[key]
-		except IndexError:
-			raise ColumnIndexError(self._row, key, len(self._cells))
+		if isinstance(key, slice):
+			return [self._cell(i) for i in range(len(self))[key]]
+		n = len(self)
+		if key < 0:
+			key = key + n
+		if key < 0 or key >= n:
+			raise ColumnIndexError(self._row, key, n)
+		return self._cell(key)
 
 	def __len__(self):
-		return len(self._cells)
+		return len(self._data) // CELL_FIELDS
 
 	def __iter__(self):
-		return iter(self._cells)
+		return (self._cell(i) for i in range(len(self)))
 
 	def __str__(self):
-		return '{0:>3}: [{1}]'.format(self._row, ', '.join(['{0}'.format(c) for c in self._cells]))
+		return '{0:>3}: [{1}]'.format(self._row, ', '.join(['{0}'.format(c) for c in self]))
+
+	def cell_texts(self, line_content):
+		'''Gets the text of each cell, excluding delimiters and surrounding whitespace, from the content of the row's line.'''
+		data = self._data
+		return [line_content[data[i+2]:data[i+3]].strip() for i in range(0, len(data), CELL_FIELDS)]
+
+	def capture_level(self, i):
+		'''Gets the capture level of the cell at index i, without creating its TableCell.'''
+		return self._data[i*CELL_FIELDS + 5]
+
+	def regions(self, max_level=None):
+		'''Gets a region for each of the row's cells at or below the given capture level, without creating their TableCells.
+
+		Each region has the same extent and direction as the cell's TableCell.'''
+		data = self._data
+		line_start = self._line_start
+		starts = data[0::CELL_FIELDS]
+		ends = data[1::CELL_FIELDS]
+		if self._direction < 0:
+			starts, ends = ends, starts
+		levels = data[5::CELL_FIELDS]
+		if max_level is None or len(levels) == 0 or max(levels) <= max_level:
+			return [Region(line_start + a, line_start + b) for a, b in zip(starts, ends)]
+		return [Region(line_start + a, line_start + b)
+			for a, b, level in zip(starts, ends, levels) if level <= max_level]
+
+	def _cell(self, i):
+		if self._cells is None:
+			self._cells = {}
+		cell = self._cells.get(i)
+		if cell is None:
+			line_start = self._line_start
+			capture_start, capture_end, cell_start, cell_end, col_index, capture_level = self._data[i*CELL_FIELDS:(i+1)*CELL_FIELDS]
+			cell = TableCell(self._row, col_index, line_start + capture_start, line_start + capture_end,
+				line_start + cell_start, line_start + cell_end, capture_level, self._direction)
+			self._cells[i] = cell
+		return cell
+
+	def intersecting_cells(self, begin, end=None, full_extent=True):
+		'''Gets the cells whose extent overlaps the region from begin to end, including either extreme end.
+
+		With capture level "cell", a single point can intersect two cells.'''
+		if end is None:
+			end = begin
+		begin = begin - self._line_start
+		end = end - self._line_start
+		begins, ends = self._cell_bounds(full_extent)
+		if begins is None:
+			indexes = []
+			for i in range(len(self)):
+				cell_begin, cell_end = self._extent(i, full_extent)
+				if cell_begin <= end and begin <= cell_end:
+					indexes.append(i)
+		else:
+			# The cells overlapping the region are those that end at or after its beginning,
+			# and begin at or before its end.
+			indexes = range(bisect.bisect_left(ends, begin), bisect.bisect_right(begins, end))
+		return [self._cell(i) for i in indexes]
+
+	def _extent(self, i, full_extent):
+		'''Gets the extent of the cell at index i, relative to the start of the line.'''
+		capture_start, capture_end, cell_start, cell_end, col_index, capture_level = self._data[i*CELL_FIELDS:(i+1)*CELL_FIELDS]
+		if full_extent or col_index == 0:
+			return min(cell_start, capture_start), max(cell_end, capture_end)
+		return cell_start, cell_end
+
+	def _cell_bounds(self, full_extent):
+		'''Gets sorted arrays of the beginnings and ends of the row's cell extents, relative to the start of the line.
+
+		Returns (None, None) if the cells' extents aren't in order, and so can't be searched.'''
+		bounds = self._bounds.get(full_extent)
+		if bounds is None:
+			begins = array('l')
+			ends = array('l')
+			for i in range(len(self)):
+				cell_begin, cell_end = self._extent(i, full_extent)
+				if len(begins) > 0 and (cell_begin < begins[-1] or cell_end < ends[-1]):
+					begins = ends = None
+					break
+				begins.append(cell_begin)
+				ends.append(cell_end)
+			bounds = (begins, ends)
+			self._bounds[full_extent] = bounds
+		return bounds
+
+	def reset(self):
+		'''Discards the TableCells created for the row, along with any state added to them by a previous command.'''
+		self._cells = None
+
+	def shift(self, row_delta, point_delta):
+		'''Moves the row by the given number of rows and points due to an edit above it.'''
+		self._row = self._row + row_delta
+		self._last_row = self._last_row + row_delta
+		self._line_start = self._line_start + point_delta
+		self._cells = None
 
 
 class TableColumn:
@@ -169,17 +326,122 @@ class TableColumn:
 		return False
 
 
+class TableColumnIndex:
+	'''Indexes the row spans of TableColumns by column index, to quickly check whether a cell is within any of them.'''
+	def __init__(self):
+		self._spans = {} # keyed by column index, each a sorted list of disjoint [first_row, last_row] spans
+
+	def add(self, column):
+		'''Adds the row span of the given TableColumn to the index.'''
+		first_row = column[0].row
+		last_row = column[-1].row
+		spans = self._spans.setdefault(column[0].col, [])
+		i = bisect.bisect_left(spans, [first_row, last_row])
+		# Merge with any spans that overlap the new one
+		if i > 0 and spans[i-1][1] >= first_row:
+			i = i - 1
+			first_row = spans[i][0]
+		j = i
+		while j < len(spans) and spans[j][0] <= last_row:
+			last_row = max(last_row, spans[j][1])
+			j = j + 1
+		spans[i:j] = [[first_row, last_row]]
+
+	def contains(self, cell):
+		'''Returns True if the given TableCell is within the span of any indexed column.'''
+		spans = self._spans.get(cell.col)
+		if spans is None:
+			return False
+		i = bisect.bisect_right(spans, [cell.row, float('inf')]) - 1
+		return i >= 0 and spans[i][1] >= cell.row
+
+
+class ColumnSkipIndex:
+	'''Finds the rows of a single table that have a given column, to skip past rows that are too short,
+	or whose cell in the column is at a higher capture level than is being navigated.'''
+	def __init__(self, rows, before_error, after_error):
+		'''Creates a ColumnSkipIndex with the following properties:
+
+		* `rows`: the TableRows of the table, in order
+		* `before_error`: the exception class raised for the row before the table
+		* `after_error`: the exception class raised for the row after the table
+		'''
+		self.first_row = rows[0].row
+		self.last_row = rows[-1].last_row
+		self._rows = rows
+		self._before_error = before_error
+		self._after_error = after_error
+		self._rows_with_column = {} # keyed by (column index, maximum capture level)
+		self.column_names = None # set by the TableView the first time it's needed
+
+	def contains(self, r):
+		return self.first_row <= r and r <= self.last_row
+
+	def header_row(self):
+		'''Gets the index of the table's header row, or None if the table doesn't have one.
+
+		The header row is the first row that isn't a markup row, provided that it's immediately followed by a markup row.'''
+		for i, row in enumerate(self._rows):
+			if not row.is_markup:
+				if i + 1 < len(self._rows) and self._rows[i+1].is_markup:
+					return row.row
+				return None
+		return None
+
+	def _rows_with(self, ic, max_level):
+		key = (ic, max_level)
+		rows = self._rows_with_column.get(key)
+		if rows is None:
+			rows = array('l', (row.row for row in self._rows
+				if ic < len(row) and (max_level is None or row.capture_level(ic) <= max_level)))
+			self._rows_with_column[key] = rows
+		return rows
+
+	def next_row(self, r, ic, dr, max_level=None, count=1):
+		'''Gets the count-th row after row r, in direction dr, which has a cell with column index ic,
+		at or below the given capture level.
+
+		If there are fewer than count such rows, the last one before the end of the table is returned.
+		Raises the exception for the row before or after the table if there is no such row.'''
+		rows = self._rows_with(ic, max_level)
+		if dr > 0:
+			i = bisect.bisect_right(rows, r)
+			if i < len(rows):
+				return rows[min(i + count - 1, len(rows) - 1)]
+			raise self._after_error(self.last_row + 1)
+		i = bisect.bisect_left(rows, r) - 1
+		if i >= 0:
+			return rows[max(i - count + 1, 0)]
+		raise self._before_error(self.first_row - 1)
+
+
 class TableView:
 	'''Parses and caches row-like lines from the current view.
 
 	Note that a view can contain multiple, disjoint tables. This class
 	makes no effort to distinguish between separate tables.
+
+	Parsed rows are also stored in a cache that persists across commands
+	until the view's buffer is modified.
 	'''
-	def __init__(self, view, context, cell_direction=1):
-		self.view = view
+	def __init__(self, view, context, cell_direction=1, row_cache=None):
+		'''Creates a TableView of the given view. Rows are parsed into the persistent row cache,
+		unless another dictionary is given as the row_cache, in which case no other thread can
+		be using it, so the persistent row cache's lock isn't held while parsing.'''
+		self.view = instrument_view(view)
 		self._context = context
 		self._cell_direction = cell_direction
 		self._rows = {}
+		if row_cache is None:
+			self._row_cache = get_row_cache(view, context, cell_direction)
+			self._row_cache_lock = row_cache_lock
+		else:
+			self._row_cache = row_cache
+			self._row_cache_lock = threading.RLock()
+		self._records = get_record_index(view, context)
+		self._block_size = _initial_block_size
+		self._extents = None
+		self._windows = None
 
 	def __getitem__(self, key):
 		try:
@@ -190,25 +452,86 @@ class TableView:
 
 	@property
 	def rows(self):
-		return list(self._rows.values())
+		# The lines of a multi-line record share the same TableRow
+		return list({id(row): row for row in self._rows.values()}.values())
 
 	def current_cells(self):
 		'''Gets the cells of the currently selected regions.
 
 		Assumes that each region overlaps a single table cell.'''
+		regions = list(self.view.sel())
+		rows = self.rows_at_points([region.b for region in regions])
 		cells = []
-		for region in self.view.sel():
+		for r, region in zip(rows, regions):
 			if region.size() == 0:
-				cell = self.cell_at_point(region.a)
+				cell = self._cell_in_row(r, region.a)
 			else:
-				cell = self.cell_at_region(region)
+				cell = self._cell_at_region_in_row(r, region)
 			cells.append(cell)
 		return cells
 
+	def rows_at_points(self, points):
+		'''Gets the row index of each of the given points, which must be in ascending order.
+
+		Rather than looking up the row of each point in the view, the newlines between
+		consecutive points are counted from as few reads of the view as possible.
+		The rows are also loaded in blocks.'''
+		rows = []
+		i = 0
+		n = len(points)
+		while i < n:
+			# Group the following points that are close enough together to read the text between them
+			j = i + 1
+			while j < n and points[j] - points[j-1] <= _max_point_gap and points[j] - points[i] <= _max_read_size:
+				j = j + 1
+			r = self.view.rowcol(points[i])[0]
+			rows.append(r)
+			if j > i + 1:
+				base = points[i]
+				text = self.view.substr(Region(base, points[j-1]))
+				for k in range(i + 1, j):
+					r = r + text.count('\n', points[k-1] - base, points[k] - base)
+					rows.append(r)
+			i = j
+		self._load_row_clusters(rows)
+		return rows
+
+	def region_rows(self, regions):
+		'''Gets the first and last row index of each of the given regions, which must be sorted and not overlap.'''
+		rows = self.rows_at_points([p for region in regions for p in (region.begin(), region.end())])
+		return list(zip(rows[0::2], rows[1::2]))
+
+	def cells_at_points(self, points):
+		'''Gets the TableCell that contains each of the given points, which must be in ascending order.'''
+		return [self._cell_in_row(r, point) for r, point in zip(self.rows_at_points(points), points)]
+
+	def spans_one_row(self, first_row, last_row):
+		'''Checks whether the lines from first_row to last_row are all part of the same row.'''
+		if first_row == last_row:
+			return True
+		if self._records is None:
+			return False
+		return self._records.record_bounds(self.view, first_row)[1] >= last_row
+
+	def _load_row_clusters(self, rows):
+		'''Loads the given rows, reading rows that are near each other from the view together.'''
+		first_row = last_row = None
+		for r in sorted(set(rows)):
+			if last_row is not None and r - last_row > _initial_block_size:
+				self.load_rows(first_row, last_row)
+				first_row = None
+			if first_row is None:
+				first_row = r
+			last_row = r
+		if first_row is not None:
+			self.load_rows(first_row, last_row)
+
 	def row(self, r):
-		'''Gets the TableRow the given row index.'''
+		'''Gets the TableRow the given row index.
+
+		For a CSV record that spans multiple lines, the same TableRow is returned for each of its lines.'''
 		if r not in self._rows:
-			self._rows[r] = self._parse_row(r)
+			self._rows[r] = self._cached_row(r)
 		return self._rows[r]
 
 	def cell(self, r, ic):
@@ -216,13 +539,167 @@ class TableView:
 		row = self.row(r)
 		return row[ic]
 
+	def try_cell(self, r, ic):
+		'''Gets the cell with table column index ic on the row with index r, or None if the row doesn't have enough cells.
+
+		Raises RowNotInTableError or RowOutOfFileBounds if the row isn't part of a table.'''
+		row = self.row(r)
+		if ic >= len(row):
+			return None
+		return row[ic]
+
+	def next_row_with_column(self, r, ic, dr, max_level=None, count=1):
+		'''Gets the index of the count-th row after row r, in direction dr, which has a cell with table column index ic
+		at or below the given capture level.
+
+		The rows after row r are read in blocks, and checked one at a time, up to the end of the table or of the
+		large file window around row r. If the table's ColumnSkipIndex has already been built, rows that don't
+		have a matching cell are skipped using it instead. If the end is reached before count rows are found,
+		the last row found is returned. Raises RowNotInTableError or RowOutOfFileBounds if no row is found.'''
+		index = self._cached_skip_index(r)
+		if index is not None:
+			return index.next_row(r, ic, dr, max_level, count)
+		window_first, window_last = self.row_window(r)
+		limit = window_last if dr > 0 else window_first
+		found = None
+		row = self.row(r)
+		while count > 0:
+			target_row = row.last_row + 1 if dr > 0 else row.row - 1
+			if target_row < 0:
+				error = RowOutOfFileBounds
+				break
+			if limit is not None and (target_row - limit) * dr > 0:
+				error = RowNotInTableError
+				break
+			self.load_rows_from(target_row, dr, limit)
+			row = self._row_cache[target_row]
+			if isinstance(row, type):
+				error = row
+				break
+			if ic < len(row) and (max_level is None or row.capture_level(ic) <= max_level):
+				found = row.row
+				count = count - 1
+		if found is None:
+			raise error(target_row)
+		return found
+
+	def _adjacent_row(self, r, dr):
+		'''Gets the index of the first line of the row before or after row r, in direction dr.'''
+		if self._records is None:
+			return r + dr
+		if dr > 0:
+			return self.row(r).last_row + 1
+		if r < 1:
+			return r - 1
+		return self.row(r - 1).row
+
+	def table_bounds(self, r):
+		'''Gets the first and last rows of the table containing row r, which must be a table row.
+
+		If the selector bounds of the table are known, all of its rows are read from the view at once.
+		Otherwise, the rows are read in blocks, up to the first row that isn't part of the table.'''
+		first_row, last_row = self.table_row_bounds(r)
+		if first_row is not None and last_row is not None:
+			self.load_rows(first_row, last_row)
+		index = self._skip_index(r)
+		return (index.first_row, index.last_row)
+
+	def table_rows(self, first_row, last_row):
+		'''Gets the TableRows from first_row to last_row, which must all be table rows, in order.
+
+		Any rows that aren't cached are read from the view at once. A multi-line CSV record is only included once.'''
+		self.load_rows(first_row, last_row)
+		rows = []
+		r = first_row
+		while r <= last_row:
+			row = self._row_cache[r]
+			rows.append(row)
+			r = row.last_row + 1
+		return rows
+
+	def header_row(self, r):
+		'''Gets the index of the header row of the table containing row r, or None if the table doesn't have one.'''
+		return self._skip_index(r).header_row()
+
+	def column_names(self, r):
+		'''Gets the names of the columns of the table containing row r, taken from its header row.
+
+		The names are read once per table, and cached until the buffer is modified.
+		Returns an empty list if the table doesn't have a header row.'''
+		index = self._skip_index(r)
+		if index.column_names is None:
+			header = index.header_row()
+			if header is None:
+				index.column_names = []
+			else:
+				row = self.row(header)
+				start = self.view.text_point(header, 0)
+				line_content = self.view.substr(Region(start, self.view.line(self.view.text_point(row.last_row, 0)).end()))
+				index.column_names = row.cell_texts(line_content)
+		return index.column_names
+
+	def column_index(self, r, name):
+		'''Gets the index of the column with the given name in the table containing row r.
+
+		An exact match of the name is preferred, otherwise the first column whose name matches
+		ignoring case is used. Raises ColumnNameNotFoundError if no column matches.'''
+		names = self.column_names(r)
+		if name in names:
+			return names.index(name)
+		folded = name.casefold()
+		for ic, column_name in enumerate(names):
+			if column_name.casefold() == folded:
+				return ic
+		raise ColumnNameNotFoundError(name)
+
+	def _cached_skip_index(self, r):
+		'''Gets the ColumnSkipIndex of the table containing row r if it has already been built, otherwise None.'''
+		for index in get_skip_indexes(self.view, self._context):
+			if index.contains(r):
+				return index
+		return None
+
+	def _skip_index(self, r):
+		'''Gets the ColumnSkipIndex of the table containing row r, which must be a table row.'''
+		index = self._cached_skip_index(r)
+		if index is not None:
+			return index
+		indexes = get_skip_indexes(self.view, self._context)
+		first_row, last_row = self.table_row_bounds(r)
+		rows_before, before_error = self._table_rows(r - 1, -1, first_row)
+		rows_after, after_error = self._table_rows(r, 1, last_row)
+		rows_before.reverse()
+		index = ColumnSkipIndex(rows_before + rows_after, before_error, after_error)
+		indexes.append(index)
+		return index
+
+	def _table_rows(self, r, dr, limit):
+		'''Gets the TableRows from row r, in direction dr, to the end of the table.
+
+		Also returns the exception class of the first row beyond the end of the table.'''
+		rows = []
+		while True:
+			if r < 0:
+				return rows, RowOutOfFileBounds
+			if limit is not None and (r - limit) * dr > 0:
+				return rows, RowNotInTableError
+			self.load_rows_from(r, dr, limit)
+			row = self._row_cache[r]
+			if isinstance(row, type):
+				return rows, row
+			rows.append(row)
+			r = row.last_row + 1 if dr > 0 else row.row - 1
+
 	def row_at_point(self, point):
 		'''Gets the TableRow at the given view point.'''
 		r = self.view.rowcol(point)[0]
 		return self.row(r)
 
 	def cell_at_region(self, region):
-		cells = self.intersecting_cells(region.b)
+		return self._cell_at_region_in_row(self.view.rowcol(region.b)[0], region)
+
+	def _cell_at_region_in_row(self, r, region):
+		cells = self.row(r).intersecting_cells(region.b)
 		if len(cells) == 1:
 			return cells[0]
 		# if len(cells) > 0, capture level is cell and r.b is at the point that intersects two cells
@@ -233,15 +710,23 @@ class TableView:
 			else:
 				return cells[0]
 		# return the cell that contains both region.a and region.b
-		common_cells = [cell for cell in cells if cell.intersects(sublime.Region(region.a, region.a))]
+		common_cells = [cell for cell in cells if cell.intersects(Region(region.a, region.a))]
 		if len(common_cells) == 1: # this _should_ alwals be true
 			return common_cells[0]
 		return cells[0]
 
 	def cell_at_point(self, point):
 		'''Gets the TableCell that contains the given view point.'''
-		(r, ic) = self.table_coords(point)
-		return self.cell(r, ic)
+		return self._cell_in_row(self.view.rowcol(point)[0], point)
+
+	def _cell_in_row(self, r, point):
+		'''Gets the TableCell that contains the given view point, which is on row r.'''
+		cells = self.row(r).intersecting_cells(point)
+		if len(cells) > 1 and self._cell_direction < 0:
+			cell = cells[1]
+		else:
+			cell = cells[0]
+		return self.cell(r, cell.col)
 
 	def cell_index(self, point):
 		'''Gets the column index of the cell at the given view point.'''
@@ -252,12 +737,12 @@ class TableView:
 
 		With capture level "cell", a single point can intersect two cells.'''
 		r = self.view.rowcol(point)[0]
-		return [c for c in self.row(r) if c.intersects(sublime.Region(point, point), full_extent=True)]
+		return self.row(r).intersecting_cells(point)
 
 	def table_coords(self, point):
 		'''Gets the row and column indexes of the cell at the given view point.'''
 		r = self.view.rowcol(point)[0]
-		cells = self.intersecting_cells(point)
+		cells = self.row(r).intersecting_cells(point)
 		if len(cells) > 1 and self._cell_direction < 0:
 			cell = cells[1]
 		else:
@@ -265,23 +750,218 @@ class TableView:
 		return (r, cell.col)
 
 	def parse_selected_rows(self):
-		selection_lines = itertools.chain.from_iterable((self.view.lines(r) for r in self.view.sel()))
-		unique_rows = set([self.view.rowcol(line.a)[0] for line in selection_lines])
-		self._rows = { row:self._parse_row(row) for row in unique_rows}
+		unique_rows = set()
+		for first_row, last_row in self.region_rows(list(self.view.sel())):
+			unique_rows.update(range(first_row, last_row + 1))
+		self._rows = {}
+		for row in sorted(unique_rows):
+			self.row(row)
+
+	def _cached_row(self, row_num):
+		'''Gets the row from the persistent row cache, parsing it if it isn't cached yet.'''
+		try:
+			row = self._row_cache[row_num]
+		except KeyError:
+			add_count('row cache misses')
+			if self._records is not None and row_num >= 0:
+				# The row might be part of a record that starts on an earlier line
+				self.load_rows(row_num, row_num)
+				row = self._row_cache[row_num]
+			else:
+				with self._row_cache_lock:
+					try:
+						row = self._parse_row(row_num)
+					except (RowNotInTableError, RowOutOfFileBounds) as e:
+						self._row_cache[row_num] = type(e)
+						raise
+					self._row_cache[row_num] = row
+				return row
+		else:
+			add_count('row cache hits')
+		if isinstance(row, type):
+			raise row(row_num)
+		row.reset()
+		return row
+
+	@timed('load_rows')
+	def load_rows(self, first_row, last_row):
+		'''Parses all rows from first_row to last_row, inclusive, that aren't already cached.
+
+		The rows' content is read from the view in a single call, and split into lines locally.'''
+		with self._row_cache_lock:
+			if self._records is not None:
+				self._load_records(first_row, last_row)
+			else:
+				self._load_lines(first_row, last_row)
+
+	def _load_lines(self, first_row, last_row):
+		'''Parses all rows from first_row to last_row, inclusive, that aren't already cached, where each row is a single line.'''
+		rows = [r for r in range(max(first_row, 0), last_row + 1) if r not in self._row_cache]
+		add_count('rows loaded in blocks', len(rows))
+		if len(rows) == 0:
+			return
+		first_row = rows[0]
+		last_row = rows[-1]
+		start = self.view.text_point(first_row, 0)
+		if self.view.rowcol(start)[0] != first_row:
+			# text_point returns the last point in the file if the inputs are beyond the file bounds.
+			for r in rows:
+				self._row_cache[r] = RowOutOfFileBounds
+			return
+		end = self.view.line(self.view.text_point(last_row, 0)).end()
+		lines = self.view.substr(Region(start, end)).split('\n')
+		point = start
+		for r, line_content in zip(range(first_row, last_row + 1), lines):
+			if r not in self._row_cache:
+				try:
+					self._row_cache[r] = self._parse_line(r, point, line_content)
+				except RowNotInTableError:
+					self._row_cache[r] = RowNotInTableError
+			point = point + len(line_content) + 1
+		for r in range(first_row + len(lines), last_row + 1):
+			self._row_cache[r] = RowOutOfFileBounds
+
+	def _load_records(self, first_row, last_row):
+		'''Parses all CSV records that include a line from first_row to last_row, inclusive, that aren't already cached.
+
+		Each line of a record is cached as the record's TableRow.'''
+		records = self._records
+		first_row = records.record_bounds(self.view, max(first_row, 0))[0]
+		last_row = records.record_bounds(self.view, last_row)[1]
+		# Records are always cached and discarded as a whole
+		rows = [r for r in range(first_row, last_row + 1) if r not in self._row_cache]
+		add_count('rows loaded in blocks', len(rows))
+		if len(rows) == 0:
+			return
+		first_row = rows[0]
+		last_row = rows[-1]
+		start = self.view.text_point(first_row, 0)
+		if self.view.rowcol(start)[0] != first_row:
+			for r in rows:
+				self._row_cache[r] = RowOutOfFileBounds
+			return
+		end = self.view.line(self.view.text_point(last_row, 0)).end()
+		lines = self.view.substr(Region(start, end)).split('\n')
+		point = start
+		i = 0
+		while i < len(lines):
+			r = first_row + i
+			n = records.record_bounds(self.view, r)[1] - r + 1
+			record_content = '\n'.join(lines[i:i+n])
+			if r not in self._row_cache:
+				try:
+					row = self._parse_line(r, point, record_content)
+					row.last_row = r + n - 1
+				except RowNotInTableError:
+					row = RowNotInTableError
+				for k in range(r, r + n):
+					self._row_cache[k] = row
+			point = point + len(record_content) + 1
+			i = i + n
+		for r in range(first_row + len(lines), last_row + 1):
+			self._row_cache[r] = RowOutOfFileBounds
+
+	def load_rows_from(self, r, dr, limit=None):
+		'''Loads a block of rows starting at row r in the direction dr (+1 down or -1 up), unless row r is already cached.
+
+		The block size doubles with each load, so that walking a long column takes only a few reads of the view.
+		If given, the block doesn't extend past the limit row.'''
+		if r in self._row_cache:
+			return
+		size = self._block_size
+		self._block_size = min(size * 2, _max_block_size)
+		if dr > 0:
+			last_row = r + size - 1
+			self.load_rows(r, last_row if limit is None else min(last_row, limit))
+		else:
+			first_row = r - size + 1
+			self.load_rows(first_row if limit is None else max(first_row, limit), r)
+
+	def row_window(self, r):
+		'''Gets the first and last rows of the window around row r to which whole-table operations are limited,
+		if the view is larger than the context's large file size.
+
+		Windows span the visible region and each selection, extended by the context's large file margin.
+		Since the selections are included, repeating an operation extends it by another margin. Returns
+		(None, None) if the view isn't a large file.'''
+		if not self.is_large_file():
+			return (None, None)
+		if self._windows is None:
+			self._windows = self._large_file_windows()
+		if len(self._windows) == 0:
+			return (None, None)
+		i = bisect.bisect_right(self._windows, [r, float('inf')]) - 1
+		if i >= 0 and self._windows[i][1] >= r:
+			return tuple(self._windows[i])
+		margin = self._context.large_file_margin
+		return (max(r - margin, 0), r + margin)
+
+	def is_large_file(self):
+		'''Checks whether the view is larger than the context's large file size.'''
+		large_file_size = self._context.large_file_size
+		return large_file_size is not None and self.view.size() > large_file_size
+
+	def _large_file_windows(self):
+		'''Gets the sorted, disjoint [first_row, last_row] windows around the visible region and the selections.'''
+		margin = self._context.large_file_margin
+		visible = self.view.visible_region()
+		spans = [(self.view.rowcol(visible.begin())[0], self.view.rowcol(visible.end())[0])]
+		spans.extend(self.region_rows(list(self.view.sel())))
+		windows = []
+		for first_row, last_row in sorted(spans):
+			first_row = max(first_row - margin, 0)
+			last_row = last_row + margin
+			if len(windows) > 0 and first_row <= windows[-1][1] + 1:
+				windows[-1][1] = max(windows[-1][1], last_row)
+			else:
+				windows.append([first_row, last_row])
+		log.debug("Large file: limiting whole-table operations to rows %s", windows)
+		return windows
+
+	def table_row_bounds(self, r):
+		'''Gets the first and last rows in which the context's selector could match the table containing row r.
+
+		Either bound is None if it's unknown, such as when the context has no selector, or the selector matches the whole view.'''
+		extents = self._table_extents()
+		if extents is None:
+			return (None, None)
+		bounds = extents.row_bounds(self.view, self.view.text_point(r, 0))
+		if bounds is None:
+			return (None, None)
+		return bounds
+
+	def _table_extents(self):
+		if self._extents is None:
+			self._extents = get_table_extents(self.view, self._context)
+		return self._extents
+
+	@timed('selector check')
+	def _in_selector(self, point):
+		'''Checks whether the context's selectors allow a row starting at the given point to be part of a table.'''
+		extents = self._table_extents()
+		if extents is None:
+			return True
+		extent = extents.classify(point)
+		if extent == OUTSIDE:
+			return False
+		if extent == INSIDE:
+			return True
+		score = score_tabnav_selectors(self.view, point, self._context.selector, self._context.except_selector)
+		return score > 0
 
 	def _parse_row(self, row_num):
 		point = self.view.text_point(row_num,0)
 		if self.view.rowcol(point)[0] != row_num:
 			# text_point returns the last point in the file if the inputs are beyond the file bounds.
 			raise RowOutOfFileBounds(row_num)
-		score = score_tabnav_selectors(self.view, point, self._context.selector, self._context.except_selector)
-		if score is not None and score <= 0:
-			raise RowNotInTableError(row_num)
 		line = self.view.line(point)
 		line_content = self.view.substr(line)
-		row = None
-		for parser in self._context.parsers:
-			row = parser.parse_row(line_content, row_num, point, self._cell_direction)
-			if row is not None:
-				return row
-		raise RowNotInTableError(row_num)
+		return self._parse_line(row_num, point, line_content)
+
+	def _parse_line(self, row_num, point, line_content):
+		if not self._in_selector(point):
+			raise RowNotInTableError(row_num)
+		row = self._context.parse_row(line_content, row_num, point, self._cell_direction)
+		if row is None:
+			raise RowNotInTableError(row_num)
+		return row
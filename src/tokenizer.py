@@ -0,0 +1,179 @@
+from TabNav.src.enum import capture_levels
+from TabNav.src.table import CELL_FIELDS
+from TabNav.src.util import get_logger
+from array import array
+import re
+
+log = get_logger(__package__, __name__)
+
+# The default auto_csv cell patterns, before the delimiter is formatted into them
+_default_csv_cell_patterns = [
+	'^(?P<cell>(?P<markup>(?P<content> *?(?P<trimmed>\\B|(?:[^" ].*?)|(?:"(?:"{{2}}|[^"])*?")) *)))(?={0})',
+	'(?P<cell>{0}(?P<markup>(?P<content> *?(?P<trimmed>\\B|(?:[^" ].*?)|(?:"(?:"{{2}}|[^"])*?")) *)))(?={0})',
+	'(?P<cell>{0}(?P<markup>(?P<content> *?(?P<trimmed>\\B(?=$)|(?:[^"].*?)|(?:"(?:"{{2}}|[^"])*?")) *)))$'
+]
+
+_escaped_characters = {'t': '\t'}
+_quote_or_space = '" '
+_cell_index = 3 # The index of the 'cell' capture in the (trimmed, content, markup, cell) spans
+
+
+def _unescape_delimiter(delimiter):
+	'''Gets the single character matched by the regex-escaped delimiter, or None if it matches anything else.'''
+	if len(delimiter) == 1:
+		character = delimiter
+	elif len(delimiter) == 2 and delimiter[0] == '\\' and not delimiter[1].isalnum():
+		character = delimiter[1]
+	elif len(delimiter) == 2 and delimiter[0] == '\\':
+		character = _escaped_characters.get(delimiter[1])
+	else:
+		return None
+	if character is None or re.match(r'[\w "\n]', character) is not None:
+		# Word characters change where the patterns' \B assertions match, and spaces and quotes are part of the cell syntax
+		return None
+	return character
+
+
+def compile_csv_tokenizer(patterns, delimiter, capture_level, max_cells=None):
+	'''Creates a CsvTokenizer equivalent to the given auto_csv patterns and regex-escaped delimiter.
+
+	Returns None if the patterns aren't the default auto_csv patterns, or if the delimiter isn't a single
+	character that the tokenizer supports.'''
+	if isinstance(patterns, dict):
+		patterns = [patterns]
+	if patterns is None or len(patterns) != 1 or 'line' in patterns[0] or patterns[0].get('cell') != _default_csv_cell_patterns:
+		return None
+	character = _unescape_delimiter(delimiter)
+	if character is None:
+		return None
+	return CsvTokenizer(character, capture_level, max_cells)
+
+
+class CsvTokenizer:
+	'''Splits a line into the same cells as the default auto_csv patterns, without using regexes.
+
+	The patterns backtrack heavily on long quoted fields. For a single character delimiter, the cells can
+	instead be found by searching for delimiters and quotes, following the same rules as the patterns,
+	including where they search past delimiters for a later match.'''
+	def __init__(self, delimiter, capture_level, max_cells=None):
+		self._delimiter = delimiter
+		self._capture_level = capture_level
+		self._max_cells = max_cells
+		# The index of the capture level's span in each cell's (trimmed, content, markup, cell) spans
+		self._capture_index = [v[0] for v in capture_levels.values()].index(capture_level)
+
+	def tokenize(self, line):
+		'''Gets the cell data of the line, exactly as RowParser would build it from the auto_csv patterns.
+
+		Returns an empty array if the line has no cells, or None if it has more than max_cells cells.'''
+		d = self._delimiter
+		max_cells = self._max_cells
+		n = len(line)
+		cell_data = array('l')
+		col_index = 0
+		# Each pattern starts searching for cells at the end of the last cell found by the previous patterns
+		cell_end = 0
+		# The first cell is only matched at the start of the line
+		spans = self._delimited_cell(line, n, 0, 0)
+		if spans is not None:
+			self._append(cell_data, spans, col_index)
+			col_index = col_index + 1
+			cell_end = spans[1][1]
+		# Middle cells start with a delimiter, and are followed by one
+		level = self._capture_level
+		whole_cell = self._capture_index == _cell_index
+		q = line.find(d, cell_end)
+		while q >= 0:
+			if max_cells is not None and col_index > max_cells:
+				return None
+			p = q + 1
+			end = line.find(d, p)
+			if end > p and line[p] not in _quote_or_space and line[end - 1] != ' ':
+				# Most cells are unquoted, without surrounding whitespace, so all of their captures but 'cell' are the same
+				cell_data.extend((q if whole_cell else p, end, p, end, col_index, level))
+				col_index = col_index + 1
+				cell_end = q = end
+				continue
+			spans = self._delimited_cell(line, n, q, p)
+			if spans is None:
+				q = line.find(d, p)
+			else:
+				self._append(cell_data, spans, col_index)
+				col_index = col_index + 1
+				cell_end = spans[1][1]
+				q = cell_end
+		# The last cell starts with a delimiter, and runs to the end of the line
+		q = line.find(d, cell_end)
+		while q >= 0:
+			spans = self._last_cell(line, n, q)
+			if spans is not None:
+				self._append(cell_data, spans, col_index)
+				break
+			q = line.find(d, q + 1)
+		if max_cells is not None and len(cell_data) > max_cells * CELL_FIELDS:
+			return None
+		return cell_data
+
+	def _append(self, cell_data, spans, col_index):
+		trimmed, content, cell = spans
+		capture = (trimmed, content, content, cell)[self._capture_index]
+		cell_data.extend((capture[0], capture[1], content[0], content[1], col_index, self._capture_level))
+
+	def _delimited_cell(self, line, n, cell_start, p):
+		'''Gets the (trimmed, content, cell) spans of the cell starting at p that is followed by a delimiter,
+		or None if the first or middle cell pattern wouldn't match at cell_start.'''
+		d = self._delimiter
+		s = p
+		while s < n and line[s] == ' ':
+			s = s + 1
+		if s < n and line[s] == '"':
+			i = s + 1
+			while True:
+				j = line.find('"', i)
+				if j < 0:
+					return None
+				k = j + 1
+				while k < n and line[k] == ' ':
+					k = k + 1
+				if k < n and line[k] == d:
+					return ((s, j + 1), (p, k), (cell_start, k))
+				if j + 1 < n and line[j + 1] == '"':
+					i = j + 2
+				else:
+					return None
+		end = line.find(d, p)
+		if end < 0:
+			return None
+		if s == end:
+			return ((p, p), (p, end), (cell_start, end))
+		e = end
+		while line[e - 1] == ' ':
+			e = e - 1
+		return ((s, e), (p, end), (cell_start, end))
+
+	def _last_cell(self, line, n, cell_start):
+		'''Gets the (trimmed, content, cell) spans of the final cell of the line, following the delimiter at cell_start,
+		or None if the last cell pattern wouldn't match at cell_start.'''
+		p = cell_start + 1
+		if p == n:
+			return ((p, p), (p, n), (cell_start, n))
+		if line[p] == '"':
+			i = p + 1
+			while True:
+				j = line.find('"', i)
+				if j < 0:
+					return None
+				k = j + 1
+				while k < n and line[k] == ' ':
+					k = k + 1
+				if k == n:
+					return ((p, j + 1), (p, n), (cell_start, n))
+				if line[j + 1] == '"':
+					i = j + 2
+				else:
+					return None
+		e = n
+		while e > p and line[e - 1] == ' ':
+			e = e - 1
+		# If the cell starts with a space, the trimmed capture includes the leading whitespace, and at least one character
+		return ((p, max(e, p + 1)), (p, n), (cell_start, n))
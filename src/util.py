@@ -1,5 +1,5 @@
+from TabNav.src.buffer import Region, load_settings
 import logging
-import sublime
 
 def get_logger(package, name):
     plugin_logger = logging.getLogger(package)
@@ -34,7 +34,7 @@ def merge_dictionaries(base, override, keys=None):
 
 
 def get_merged_context_configs(context_key=None):
-    settings = sublime.load_settings("tabnav.sublime-settings")
+    settings = load_settings("tabnav.sublime-settings")
     configs = settings.get("contexts", {})
     user_configs = settings.get("user_contexts", {})
     if context_key is not None:
@@ -70,6 +70,6 @@ def score_tabnav_selectors(view, point, selector, except_selector):
 
 def point_from_region_func(cell_direction):
     if cell_direction > 0:
-        return sublime.Region.end
+        return Region.end
     else:
-        return sublime.Region.begin
+        return Region.begin
@@ -0,0 +1,49 @@
+from TabNav.src.cache import get_row_cache, is_row_cache_current, row_cache_lock
+from TabNav.src.context import get_current_context
+from TabNav.src.stats import timed
+from TabNav.src.table import TableView
+from TabNav.src.util import get_logger
+
+log = get_logger(__package__, __name__)
+
+# The number of rows parsed at once, between checks for changes to the buffer
+_warm_up_block_rows = 256
+
+
+@timed('warm_up_view')
+def warm_up_view(view, margin):
+	'''Parses the rows of the view that are visible, or within margin rows of the visible region,
+	into the persistent row cache, so that the first command in a table doesn't have to.
+
+	This is intended to be run on the async thread. Rows are parsed in blocks, and the warm-up is
+	abandoned as soon as the buffer changes. Returns True if all of the rows were parsed.'''
+	change_count = view.change_count()
+	context = get_current_context(view)
+	if context is None:
+		return False
+	visible = view.visible_region()
+	first_row = max(view.rowcol(visible.begin())[0] - margin, 0)
+	last_row = view.rowcol(visible.end())[0] + margin
+	for block_start in range(first_row, last_row + 1, _warm_up_block_rows):
+		block_end = min(block_start + _warm_up_block_rows - 1, last_row)
+		with row_cache_lock:
+			if not is_row_cache_current(view, change_count):
+				log.debug("Buffer changed; abandoning the warm-up of view %s", view.id())
+				return False
+			row_cache = get_row_cache(view, context, 1)
+			if all(r in row_cache for r in range(block_start, block_end + 1)):
+				continue
+		# Rows are parsed separately, without holding the lock so that commands and edits aren't held up,
+		# and only added to the cache if the buffer didn't change while they were read, since the cache
+		# isn't updated for a change until after it's been made.
+		parsed = {}
+		TableView(view, context, row_cache=parsed).load_rows(block_start, block_end)
+		with row_cache_lock:
+			if not is_row_cache_current(view, change_count):
+				log.debug("Buffer changed; abandoning the warm-up of view %s", view.id())
+				return False
+			row_cache = get_row_cache(view, context, 1)
+			for r, row in parsed.items():
+				row_cache.setdefault(r, row)
+	log.debug("Warmed up rows %d to %d of view %s", first_row, last_row, view.id())
+	return True
@@ -34,6 +34,7 @@ def apply_listener_boolean_operator(nominal, operator, operand):
 			return nominal
 
 
+@timed('select_cells')
 def select_cells(view, selected_cells, capture_level, select=True):
 	cells = [c for c in selected_cells if c.capture_level <= capture_level]
 	if len(cells) == 0:
@@ -53,6 +54,7 @@ class TabnavCommand(sublime_plugin.TextCommand):
 	def run(self, edit, context=None):
 		raise NotImplementedError("The base TabnavCommand is not a runnable command.")
 
+	@timed_command('is_enabled')
 	def is_enabled(self, **args):
 		if not is_tabnav_enabled(self.view.settings()):
 			return False
@@ -60,18 +62,34 @@ class TabnavCommand(sublime_plugin.TextCommand):
 			return False
 		context_key = args.get('context', None)
 		capture_level = args.get('capture_level', None)
-		self.context = get_current_context(self.view, context_key, capture_level)
+		self.context = get_query_context(self.view, context_key, capture_level)
 		return self.context is not None
 
+	@timed('init_table')
 	def init_table(self, cell_direction=1):
-		'''Parses the table rows that intersect the currently selected regions.'''
-		self.table = TableView(self.view, self.context, cell_direction)
-		self.table.parse_selected_rows()
+		'''Parses the table rows that intersect the currently selected regions.
+
+		If the is_tabnav_context key binding context already parsed them for the same key press, its TableView is used.'''
+		self.table = take_query_table(self.view, self.context, cell_direction)
+		if self.table is None:
+			self.table = TableView(self.view, self.context, cell_direction)
+			self.table.parse_selected_rows()
+		else:
+			add_count('query tables reused')
 		self.tabnav = TableNavigator(self.table, self.context.capture_level, cell_direction)
 
+	def select_named_column(self, column, select=True):
+		'''Moves the current selections to the cells of the named column, on the same rows.'''
+		cells = self.tabnav.get_named_column_cells(column)
+		if not select:
+			for cell in cells:
+				cell.add_cursor_offset(0)
+		select_cells(self.view, cells, self.context.capture_level, select)
+
 
 class TabnavMoveCommand(TabnavCommand):
-	def run(self, edit, scope, forward=True, select=True, extend=0, context=None, capture_level=None):
+	@timed_command('run')
+	def run(self, edit, scope, forward=True, select=True, extend=0, context=None, capture_level=None, count=1, page=False):
 		# context and capture_level get used when building the Context object in the TabnavCommand.is_enabled method.
 		if forward:
 			delta = 1
@@ -93,6 +111,8 @@ class TabnavMoveCommand(TabnavCommand):
 			dc = 0
 			move_cursors = False
 			offset = None
+			if page:
+				count = self._page_rows()
 		else:
 			log.error("Unknown movement scope '%s'. Acceptable values are: {'row', 'column'}", scope)
 			return
@@ -106,7 +126,7 @@ class TabnavMoveCommand(TabnavCommand):
 				next_cells = self.tabnav.get_next_cells((dr, dc), return_current=False)
 				prev_cells = self.tabnav.get_next_cells((-dr, -dc), return_current=False)
 			else:
-				next_cells = self.tabnav.get_next_cells((dr, dc), offset, return_current=True)
+				next_cells = self.tabnav.get_next_cells((dr, dc), offset, return_current=True, count=max(count, 1))
 		except (CursorNotInTableError, RowNotInTableError) as e:
 			log.info(e.err)
 			return
@@ -126,9 +146,15 @@ class TabnavMoveCommand(TabnavCommand):
 			for region in regions_to_remove:
 				self.view.sel().subtract(region)
 
+	def _page_rows(self):
+		'''Gets the number of rows currently visible in the view.'''
+		visible = self.view.visible_region()
+		return max(self.view.rowcol(visible.end())[0] - self.view.rowcol(visible.begin())[0], 1)
+
 
 class TabnavMoveEndCommand(TabnavCommand):
-	def run(self, edit, scope, forward=True, select=True, extend=False, context=None, capture_level=None):
+	@timed_command('run')
+	def run(self, edit, scope, forward=True, select=True, extend=False, context=None, capture_level=None, column=None):
 		# context and capture_level get used when building the Context object in the TabnavCommand.is_enabled method.
 		try:
 			if forward:
@@ -140,11 +166,7 @@ class TabnavMoveEndCommand(TabnavCommand):
 				# TODO: this case in particular can probably be cleaned up
 				self.tabnav.split_selections(select=extend, expand_selections=not extend)
 				new_selections = []
-				for region in self.view.sel():
-					if region.size() == 0:
-						cell = self.table.cell_at_point(region.a)
-					else:
-						cell = self.table.cell_at_region(region)
+				for region, cell in zip(self.view.sel(), self.table.current_cells()):
 					if extend:
 						start = region.a
 						if forward:
@@ -170,16 +192,19 @@ class TabnavMoveEndCommand(TabnavCommand):
 				elif scope.startswith("c"): # column
 					self.init_table(cell_directions[(direction, 0, select)])
 					self.tabnav.split_selections(select)
+					if column is not None:
+						self.select_named_column(column, select)
 					if extend:
 						cells = self.tabnav.get_column_cells(direction)
 					else:
 						cells = self.tabnav.get_column_end_cells(direction)
 				select_cells(self.view, cells, self.context.capture_level, select)
-		except (CursorNotInTableError, RowNotInTableError) as e:
+		except (CursorNotInTableError, RowNotInTableError, ColumnNameNotFoundError) as e:
 			log.info(e.err)
 
 class TabnavSelectCommand(TabnavCommand):
-	def run(self, edit, scope, forward=True, select=True, context=None, capture_level=None):
+	@timed_command('run')
+	def run(self, edit, scope, forward=True, select=True, context=None, capture_level=None, column=None):
 		# context and capture_level get used when building the Context object in the TabnavCommand.is_enabled method.
 		if forward:
 			cell_direction = 1
@@ -197,40 +222,112 @@ class TabnavSelectCommand(TabnavCommand):
 				self.tabnav.split_selections(select, move_cursors=True)
 				cells = list(itertools.chain.from_iterable(row for row in self.table.rows))
 			elif scope[0] == 'c': # column
-				cells = self._get_column_cells(select)
+				cells = self._get_column_cells(select, column)
 			elif scope[0] == 't': # table
+				if not self.table.is_large_file():
+					self._select_all_tables(select)
+					return
 				cells = self._get_all_cells(select)
 			if not select:
 				for cell in cells:
 					cell.add_cursor_offset(offset)
 			select_cells(self.view, cells, self.context.capture_level, select)
-		except (CursorNotInTableError, RowNotInTableError) as e:
+		except (CursorNotInTableError, RowNotInTableError, ColumnNameNotFoundError) as e:
 			log.info(e.err)
 
-	def _get_column_cells(self, select):
+	def _get_column_cells(self, select, column=None):
 		max_level = max(v[0] for v in capture_levels.values())
 		self.tabnav.split_selections(select, capture_level=max_level, move_cursors=True)
+		if column is not None:
+			self.select_named_column(column, select)
 		columns = []
-		for region in self.view.sel():
-			cell = self.table.cell_at_point(region.end())
-			containing_columns = [col for col in columns if col.contains(cell)]
-			if len(containing_columns) > 0:
+		column_index = TableColumnIndex()
+		for cell in self.table.cells_at_points([region.end() for region in self.view.sel()]):
+			if column_index.contains(cell):
 				continue # This cell is already contained in a previously captured column
-			columns.append(self.tabnav.get_table_column(cell))
+			column = self.tabnav.get_table_column(cell, windowed=True)
+			columns.append(column)
+			column_index.add(column)
 		return [cell for col in columns for cell in col]
 
+	def _select_all_tables(self, select):
+		'''Selects all cells of all selected tables.
+
+		Each table's rows are scanned once, and the regions of their cells are built directly from the
+		parsed rows and added to the selection in a single call, without building a column for each row.'''
+		max_level = max(v[0] for v in capture_levels.values())
+		self.tabnav.split_selections(select, capture_level=max_level, move_cursors=True)
+		tables = dict(self.table.table_bounds(row.row) for row in self.table.rows)
+		rows = [row for first_row, last_row in tables.items() for row in self.table.table_rows(first_row, last_row)]
+		regions = []
+		for row in rows:
+			regions.extend(row.regions(self.context.capture_level))
+		if len(regions) == 0:
+			# If no cells at the configured capture level are selected, then select everything
+			for row in rows:
+				regions.extend(row.regions())
+		if len(regions) == 0:
+			return
+		self.view.sel().clear()
+		if select:
+			self.view.sel().add_all(regions)
+		else:
+			# Each cursor goes at the "end" of its cell, based on the cell's direction
+			self.view.sel().add_all([region.b for region in regions])
+
 	def _get_all_cells(self, select):
 		max_level = max(v[0] for v in capture_levels.values())
 		self.tabnav.split_selections(select, capture_level=max_level, move_cursors=True)
-		columns = []
+		columns = TableColumnIndex()
 		# Expand the first column in each disjoint table to parse all rows of all selected tables
 		for cell in (row[0] for row in self.table.rows):
-			containing_columns = [col for col in columns if col.contains(cell)]
-			if len(containing_columns) > 0:
+			if columns.contains(cell):
 				continue # This cell is already contained in a previously captured column
-			columns.append(self.tabnav.get_table_column(cell))
+			columns.add(self.tabnav.get_table_column(cell, windowed=True))
 		return list(itertools.chain.from_iterable(row for row in self.table.rows))
 
+class TabnavGoToColumnCommand(TabnavCommand):
+	@timed_command('run')
+	def run(self, edit, column, select=True, context=None, capture_level=None):
+		'''Moves the current selections to the named column of the table, on the same rows.
+
+		Columns are named by the table's header row, which must be followed by a markup row.'''
+		# context and capture_level get used when building the Context object in the TabnavCommand.is_enabled method.
+		try:
+			self.init_table()
+			self.tabnav.split_selections(select, move_cursors=True)
+			self.select_named_column(column, select)
+		except (CursorNotInTableError, RowNotInTableError, ColumnNameNotFoundError) as e:
+			log.info(e.err)
+
+	def input(self, args):
+		if args.get('column') is not None:
+			return None
+		context = get_current_context(self.view, args.get('context'), args.get('capture_level'))
+		if context is None:
+			return None
+		table = TableView(self.view, context)
+		try:
+			r = table.rows_at_points([self.view.sel()[0].b])[0]
+			names = table.column_names(r)
+		except (RowNotInTableError, RowOutOfFileBounds) as e:
+			log.info(e.err)
+			return None
+		return TabnavColumnInputHandler(names)
+
+
+class TabnavColumnInputHandler(sublime_plugin.ListInputHandler):
+	'''Input handler to pick the column when the TabnavGoToColumnCommand
+	is run from the command palette.'''
+	def __init__(self, names):
+		self._names = names
+
+	def name(self):
+		return "column"
+
+	def list_items(self):
+		return [name for name in self._names if name != '']
+
 # Other Commands
 
 class TabnavTrimWhitespaceFromSelectionCommand(sublime_plugin.TextCommand):
@@ -425,6 +522,18 @@ class TabnavSetCsvDelimiterMenuCommand(sublime_plugin.TextCommand):
 		return not is_other_csv_scope(self.view)
 
 
+class TabnavShowPerformanceStatsCommand(sublime_plugin.WindowCommand):
+	'''Shows the latencies, parsed rows, row cache hits and view API calls recorded for each command in an
+	output panel, when the "performance_stats" setting is enabled. If clear is True, the stats are discarded
+	once they've been shown.'''
+	def run(self, clear=False):
+		output_panel = self.window.create_output_panel('tabnav_performance_stats')
+		output_panel.run_command('append', {'characters': 'TabNav Performance Stats\n\n' + format_stats()})
+		self.window.run_command("show_panel", {"panel": "output.tabnav_performance_stats"})
+		if clear:
+			clear_stats()
+
+
 class IsTabnavContextListener(sublime_plugin.ViewEventListener):
 	@classmethod
 	def is_applicable(cls, settings):
@@ -454,24 +563,9 @@ class IsTabnavContextListener(sublime_plugin.ViewEventListener):
 				context_key = operand
 			else:
 				context_key = None
-			context = get_current_context(self.view, context_key)
-			if context is None:
-				is_context = False
-			else:
-				table = TableView(self.view, context)
-				try:
-					if match_all:
-						# parse all of the current selections
-						table.parse_selected_rows()
-					else:
-						point = self.view.sel()[0].begin()
-						r = self.view.rowcol(point)[0]
-						table[r]
-				except RowNotInTableError as e:
-					log.debug(e.err)
-					is_context = False
-				else:
-					is_context = True
+			# Memoized until the view's text, selections or settings change, since this is checked on every key press
+			with command_stats('is_tabnav_context'):
+				is_context = is_tabnav_context(self.view, context_key, match_all)
 		log.debug("Is TabNav Context: %s", is_context)
 		if isinstance(operand, bool):
 			return apply_listener_boolean_operator(is_context, operator, operand)
@@ -527,13 +621,78 @@ class TabNavViewListener(sublime_plugin.ViewEventListener):
 				pass
 
 
+class TabnavWarmUpListener(sublime_plugin.ViewEventListener):
+	'''Parses the rows around the visible region of a TabNav-enabled view in the background, when the view
+	is activated or its selection moves, so that the next command doesn't have to parse them.'''
+	@classmethod
+	def is_applicable(cls, settings):
+		return is_tabnav_enabled(settings)
+
+	def __init__(self, view):
+		super().__init__(view)
+		self._pending = 0
+
+	def on_activated_async(self):
+		self.schedule_warm_up()
+
+	def on_selection_modified_async(self):
+		self.schedule_warm_up()
+
+	def schedule_warm_up(self):
+		'''Warms up the view after a short delay, unless another warm-up is scheduled in the meantime.'''
+		margin = sublime.load_settings("tabnav.sublime-settings").get("warm_up_margin", 200)
+		if margin is None:
+			return
+		self._pending = self._pending + 1
+		pending = self._pending
+		sublime.set_timeout_async(lambda: self.warm_up(pending, margin), 100)
+
+	def warm_up(self, pending, margin):
+		if pending != self._pending or not self.view.is_valid() or len(self.view.sel()) == 0:
+			return
+		with command_stats('warm_up'):
+			warm_up_view(self.view, margin)
+
+
+class TabnavRowCacheListener(sublime_plugin.EventListener):
+	'''Discards the cached table rows and inferred CSV delimiters of views as they are closed.'''
+	def on_pre_close(self, view):
+		clear_row_caches(view.buffer_id())
+		clear_sniffed_delimiters(view.buffer_id())
+		clear_query_memos(view.id())
+
+
+if hasattr(sublime_plugin, 'TextChangeListener'): # Not available prior to Sublime Text 4
+	class TabnavRowCacheUpdater(sublime_plugin.TextChangeListener):
+		'''Keeps the cached table rows of a buffer in sync with edits, so that only
+		the rows touched by an edit need to be parsed again.'''
+		def on_text_changed(self, changes):
+			view = self.buffer.primary_view()
+			if view is None:
+				clear_row_caches(self.buffer.id())
+			else:
+				update_row_cache(self.buffer.id(), changes, view.change_count(), view.size())
+
+		def on_reload(self):
+			clear_row_caches(self.buffer.id())
+
+		def on_revert(self):
+			clear_row_caches(self.buffer.id())
+
+
 def tabnav_package_settings_listener():
 	global implicit_selectors
 	package_settings = sublime.load_settings("tabnav.sublime-settings")
+	# Context configurations may have changed, so previously built contexts and parsed rows can't be trusted
+	reload_contexts()
+	clear_row_caches()
+	clear_sniffed_delimiters()
+	clear_query_memos()
 	# Set the log level
 	log_level = package_settings.get('log_level', 'WARNING').upper()
 	log.setLevel(log_level)
 	log.info("Log level: %s", log_level)
+	set_stats_enabled(package_settings.get('performance_stats', False))
 	# Determine for which scopes TabNav is implicitly enabled
 	enable_explicitly = package_settings.get('enable_explicitly', False)
 	if enable_explicitly:
@@ -541,7 +700,7 @@ def tabnav_package_settings_listener():
 		log.debug("Global enable_explicitly flag set to True")
 	else:
 		selectors = []
-		context_configs = get_merged_context_configs()
+		context_configs = get_context_configs()
 		for key in context_configs:
 			config = context_configs[key]
 			enable_explicitly = config.get('enable_explicitly', False)
@@ -573,6 +732,9 @@ def plugin_unloaded():
 	package_settings.clear_on_change('tabnav_package_settings_listener')
 	for settings in list(settings_listeners):
 		TabNavViewListener.remove_settings_listener(settings)
+	clear_row_caches()
+	clear_sniffed_delimiters()
+	clear_query_memos()
 	
 
 # Legacy Commands